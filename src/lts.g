@@ -151,7 +151,8 @@ state_prop: 'Begin' 'State_props'
 
 prop_line: string ':' intv ';' { PREFIX add_prop($0.str,intv); intv.clear(); delete $0.str; $0.str=NULL; } ;
 
-intv: ( int { intv.push_back($0.val); } )* ;
+intv: ( int { intv.push_back($0.val); } |
+        int '..' int { for (int i = $0.val; i <= $2.val; i++) intv.push_back(i); } )* ;
 
 
 header: 'Begin' 'Header' header_variable+ ';' 'End' 'Header' { PREFIX header_done(); } ;
@@ -308,3 +308,406 @@ if [ "$(grep -A4 'observe: action "o:x == 3"' controlflow.aal.log | grep "guard
     testfailed
 fi
 testpassed
+
+teststep "remote_pyaal incremental guards"
+remote_pyaal -o incr-full.lsts --lsts-depth 8 test1.py.aal >>$LOGFILE 2>&1 || {
+    echo "failed because remote_pyaal -o test1.py.aal failed" >>$LOGFILE
+    testfailed
+}
+remote_pyaal --incremental-guards -o incr-incr.lsts --lsts-depth 8 test1.py.aal >>$LOGFILE 2>&1 || {
+    echo "failed because remote_pyaal --incremental-guards -o test1.py.aal failed" >>$LOGFILE
+    testfailed
+}
+if ! diff -u incr-full.lsts incr-incr.lsts >>$LOGFILE 2>&1; then
+    echo "failed because incremental guards changed the generated state space" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal parallel state space generation"
+remote_pyaal --jobs 3 -o jobs3.lsts --lsts-depth 8 test1.py.aal >>$LOGFILE 2>&1 || {
+    echo "failed because remote_pyaal --jobs 3 -o test1.py.aal failed" >>$LOGFILE
+    testfailed
+}
+if ! diff -u incr-full.lsts jobs3.lsts >>$LOGFILE 2>&1; then
+    echo "failed because --jobs 3 changed the generated state space" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+# decode_batches replaces batch frames in the output of remote_pyaal
+# with the fmbtmagic lines that would have been sent without batch
+# framing. Error records are decoded as "error <message>".
+decode_batches() {
+    python -c '
+import struct, sys
+data = sys.stdin.read()
+while data:
+    line, _, data = data.partition("\n")
+    if not line.startswith("fmbtmagicb "):
+        print line
+        continue
+    length = int(line.split()[1])
+    payload, data = data[:length], data[length:]
+    if len(payload) < length:
+        print "truncated frame"
+    while payload:
+        kind, count = payload[0], struct.unpack("<I", payload[1:5])[0]
+        if kind == "i":
+            print "fmbtmagic", struct.unpack("<i", payload[1:5])[0]
+            payload = payload[5:]
+        elif kind == "l":
+            items = struct.unpack("<%si" % (count,), payload[5:5 + 4 * count])
+            print "fmbtmagic", " ".join([str(i) for i in items])
+            payload = payload[5 + 4 * count:]
+        elif kind in "se":
+            print {"s": "fmbtmagic", "e": "error"}[kind], payload[5:5 + count].rstrip("\n")
+            payload = payload[5 + count:]
+        else:
+            print "unknown record", kind
+            break
+'
+}
+
+teststep "remote_pyaal batch framing"
+printf 'mr\nma\nmp\n' | remote_pyaal test1.py.aal > batch-plain.out 2>>$LOGFILE &&
+printf 'mr\nbf\nma;mp\nma;;mp;\n' | remote_pyaal test1.py.aal > batch.out 2>>$LOGFILE || {
+    echo "failed because remote_pyaal test1.py.aal failed in batch framing" >>$LOGFILE
+    testfailed
+}
+if [ "$(grep -ao 'fmbtmagicb [0-9]*' batch.out | wc -l)" != "2" ]; then
+    echo "failed because batch.out does not contain exactly two batch frames" >>$LOGFILE
+    testfailed
+fi
+# replies in both frames must equal unbatched replies
+( head -n -2 batch-plain.out; echo "fmbtmagic 1"; tail -n 2 batch-plain.out; tail -n 2 batch-plain.out ) > batch.expected
+if ! decode_batches < batch.out | diff -u batch.expected - >>$LOGFILE 2>&1; then
+    echo "failed because batched replies differ from unbatched replies" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal batch framing with an error"
+printf 'mr\nbf\nma;mp;\nma;;xx;mp\n' | remote_pyaal test1.py.aal > batch-error.out 2>>$LOGFILE && {
+    echo "failed because remote_pyaal did not fail on an unexpected command in a batch" >>$LOGFILE
+    testfailed
+}
+# empty commands must not fail, and the last frame must contain the
+# reply to ma and an error record, and nothing may follow it
+( head -n -2 batch-plain.out; echo "fmbtmagic 1"; tail -n 2 batch-plain.out
+  tail -n 2 batch-plain.out | head -n 1
+  echo 'error remote_pyaal error: Unexpected command: "xx". remote_pyaal works with "aal_remote" model.'
+) > batch-error.expected
+if ! decode_batches < batch-error.out | diff -u batch-error.expected - >>$LOGFILE 2>&1; then
+    echo "failed because batch-error.out does not end with a complete frame with an error record" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal lookahead"
+# compare scores from ml with scores computed by simulating the same
+# paths with mu, m<n>, ma, mp and mo. Paths that start with iLeft end
+# after one step, and the other paths after three steps.
+python - >>$LOGFILE 2>&1 <<EOF
+import subprocess, sys
+p = subprocess.Popen(["remote_pyaal", "lookahead.aal"],
+                     stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+def reply(cmd):
+    p.stdin.write(cmd + "\n")
+    p.stdin.flush()
+    if cmd in ["mu", "mo"]:
+        return None
+    return p.stdout.readline()[len("fmbtmagic "):].rstrip("\n")
+def ints(cmd):
+    return [int(i) for i in reply(cmd).split()]
+while p.stdout.readline() != "fmbtmagic \n": pass # action names
+while p.stdout.readline() != "fmbtmagic \n": pass # tag names
+def covers(action, covered, actions, tags):
+    reply("m%s" % (action,))
+    if action in actions:
+        covered = covered | set([action])
+    return covered | set([-tag for tag in ints("mp") if tag in tags])
+def search(depth_left, covered, actions, tags):
+    best = len(covered)
+    if depth_left == 0:
+        return best
+    for action in ints("ma"):
+        reply("mu")
+        best = max(best, search(depth_left - 1, covers(action, covered, actions, tags), actions, tags))
+        reply("mo")
+    return best
+def scores(depth, actions, tags):
+    rv = []
+    for action in ints("ma"):
+        reply("mu")
+        rv.extend([action, search(depth - 1, covers(action, set(), actions, tags), actions, tags)])
+        reply("mo")
+    return rv
+failed = False
+reply("mr")
+for prefix in [[], [2]]:
+    for action in prefix:
+        reply("m%s" % (action,))
+    for depth in [1, 2, 3, 4]:
+        for actions, tags in [([], []), ([1, 3], []), ([1, 2, 3], [1]), ([3], [1])]:
+            cmd = "ml%s %s" % (depth, " ".join([str(a) for a in actions] + ["t%s" % (t,) for t in tags]))
+            enabled = ints("ma")
+            observed = ints(cmd)
+            expected = scores(depth, actions, tags)
+            print prefix, cmd, observed, expected
+            if observed != expected or ints("ma") != enabled:
+                failed = True
+p.stdin.close()
+sys.exit(failed or p.wait())
+EOF
+if [ "$?" != "0" ]; then
+    echo "failed because ml scores differ from simulated scores" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal simulation cache"
+remote_pyaal --simulation-cache 100 -o simcache.lsts --lsts-depth 8 test1.py.aal >>$LOGFILE 2>&1 || {
+    echo "failed because remote_pyaal --simulation-cache 100 -o test1.py.aal failed" >>$LOGFILE
+    testfailed
+}
+if ! diff -u incr-full.lsts simcache.lsts >>$LOGFILE 2>&1; then
+    echo "failed because simulation cache changed the generated state space" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal compiled model cache"
+rm -rf model-cache
+for run in 1 2; do
+    XDG_CACHE_HOME=$(pwd)/model-cache remote_pyaal -l modelcache$run.log -o modelcache$run.lsts --lsts-depth 8 test1.py.aal >>$LOGFILE 2>&1 || {
+        echo "failed because remote_pyaal run $run with model cache failed" >>$LOGFILE
+        testfailed
+    }
+done
+if grep -q "using compiled model from cache" modelcache1.log; then
+    echo "failed because the first run used a compiled model from empty cache" >>$LOGFILE
+    testfailed
+fi
+if ! grep -q "using compiled model from cache" modelcache2.log; then
+    echo "failed because the second run did not use the compiled model from cache" >>$LOGFILE
+    testfailed
+fi
+if ! diff -u modelcache1.lsts modelcache2.lsts >>$LOGFILE 2>&1; then
+    echo "failed because the cached model generated a different state space" >>$LOGFILE
+    testfailed
+fi
+# a cached model that fails to execute must be reported as such
+if XDG_CACHE_HOME=$(pwd)/model-cache remote_pyaal -c "import sys; sys.modules['aalmodel'] = None" -o modelcache3.lsts test1.py.aal >>$LOGFILE 2>modelcache3.err ||
+   ! grep -q "executing aal code failed" modelcache3.err; then
+    cat modelcache3.err >>$LOGFILE
+    echo "failed because executing a cached model that raises an exception was not reported" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal server"
+rm -f server.sock
+remote_pyaal -l server.log --server server.sock tags.aal >>$LOGFILE 2>&1 &
+server_pid=$!
+for wait in 1 2 3 4 5 6 7 8 9 10; do
+    [ -S server.sock ] && break
+    sleep 1
+done
+sed -e "s/remote_pyaal -l tags.aal.log 'tags.aal'/remote_pyaal --connect server.sock/" tags.conf > server.conf
+server_failed=0
+for engine in 1 2; do
+    fmbt -l server$engine.log server.conf >>$LOGFILE 2>&1 || {
+        echo "failed because test run $engine with remote_pyaal server failed" >>$LOGFILE
+        server_failed=1
+    }
+done
+kill $server_pid
+wait $server_pid
+if [ "$server_failed" != "0" ] || [ "$(grep -c 'serving connection' server.log)" != "2" ]; then
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal server resets the model after adapter_exit"
+rm -f serverreset.sock
+remote_pyaal -l serverreset.log --server serverreset.sock serverreset.aal >>$LOGFILE 2>&1 &
+server_pid=$!
+for wait in 1 2 3 4 5 6 7 8 9 10; do
+    [ -S serverreset.sock ] && break
+    sleep 1
+done
+# adapter_exit changes the model, so mr must reset it even though the
+# server reset the model before the connection
+printf 'ae pass\nmr\nma\nmp\n' | remote_pyaal --connect serverreset.sock > serverreset.out 2>>$LOGFILE
+kill $server_pid
+wait $server_pid
+printf 'fmbtmagic 1\nfmbtmagic 1\nfmbtmagic 1\nfmbtmagic \n' > serverreset.expected
+if ! tail -n 4 serverreset.out | diff -u serverreset.expected - >>$LOGFILE 2>&1; then
+    echo "failed because mr after ae did not reset the model" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal profile"
+rm -f profile.txt
+remote_pyaal --profile profile.txt -o profile.lsts --lsts-depth 3 test1.py.aal >>$LOGFILE 2>&1 || {
+    echo "failed because remote_pyaal --profile failed" >>$LOGFILE
+    testfailed
+}
+if ! grep -q "^guard	\*	" profile.txt || ! grep -q "^body	\*	" profile.txt; then
+    echo "failed because guard and body times are missing from profile.txt" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "fmbt-aal-walk"
+fmbt-aal-walk -n 20 -L 10 -o walk1.txt test1.py.aal >>$LOGFILE 2>&1 &&
+fmbt-aal-walk -n 20 -L 10 -j 2 -o walk2.txt test1.py.aal >>$LOGFILE 2>&1 || {
+    echo "failed because fmbt-aal-walk failed" >>$LOGFILE
+    testfailed
+}
+if ! diff -u walk1.txt walk2.txt >>$LOGFILE 2>&1; then
+    echo "failed because parallel walks generated different traces" >>$LOGFILE
+    testfailed
+fi
+if [ ! -s walk1.txt ] || [ -n "$(awk 'BEGIN{RS=""}{gsub(/\n/," "); print}' walk1.txt | sort | uniq -d)" ]; then
+    echo "failed because fmbt-aal-walk generated no traces or duplicate traces" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal tag cache"
+remote_pyaal --tag-cache 0 -o tagcache0.lsts --lsts-depth 5 tags.aal >>$LOGFILE 2>&1 &&
+remote_pyaal --tag-cache 2 -o tagcache2.lsts --lsts-depth 5 tags.aal >>$LOGFILE 2>&1 || {
+    echo "failed because remote_pyaal --tag-cache failed" >>$LOGFILE
+    testfailed
+}
+if ! diff -u tagcache0.lsts tagcache2.lsts >>$LOGFILE 2>&1; then
+    echo "failed because tag cache changed the generated state space" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal lsts cache"
+rm -f lstscache.cache
+remote_pyaal -o lstscache0.lsts --lsts-depth 5 test1.py.aal >>$LOGFILE 2>&1 &&
+remote_pyaal --lsts-cache lstscache.cache -o lstscache1.lsts --lsts-depth 5 test1.py.aal >>$LOGFILE 2>&1 &&
+remote_pyaal --lsts-cache lstscache.cache -o lstscache2.lsts --lsts-depth 5 test1.py.aal >>$LOGFILE 2>&1 || {
+    echo "failed because remote_pyaal --lsts-cache failed" >>$LOGFILE
+    testfailed
+}
+if ! diff -u lstscache0.lsts lstscache1.lsts >>$LOGFILE 2>&1 ||
+   ! diff -u lstscache0.lsts lstscache2.lsts >>$LOGFILE 2>&1; then
+    echo "failed because lsts cache changed the generated state space" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal writes in nested code"
+printf 'mr\nma\nmp\nmu\nm1\nm1\nma\nmp\nmo\nma\nmp\n' | remote_pyaal nestedwrites.aal > nestedwrites.out 2>>$LOGFILE || {
+    echo "failed because remote_pyaal nestedwrites.aal failed" >>$LOGFILE
+    testfailed
+}
+# replies to ma and mp after mo must equal replies before mu
+replies="$(tail -n 9 nestedwrites.out)"
+if [ "$(sed -n '2,3p' <<<"$replies")" != "$(sed -n '8,9p' <<<"$replies")" ] ||
+   [ "$(sed -n '2,3p' <<<"$replies")" == "$(sed -n '6,7p' <<<"$replies")" ]; then
+    cat nestedwrites.out >>$LOGFILE
+    echo "failed because pop did not restore variables written in nested code" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal incremental guards with nested code"
+for opt in "" --incremental-guards; do
+    printf 'mr\nma\nm1\nma\nm3\nma\nm3\nma\n' | remote_pyaal $opt nestedwrites.aal > nestedguards$opt.out 2>>$LOGFILE || {
+        echo "failed because remote_pyaal $opt nestedwrites.aal failed" >>$LOGFILE
+        testfailed
+    }
+done
+if ! diff -u nestedguards.out nestedguards--incremental-guards.out >>$LOGFILE 2>&1; then
+    echo "failed because incremental guards missed changes made by nested code or to untracked globals" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal simulation cache with nested code"
+for size in 0 100; do
+    printf 'mr\nmu\nm1\nmo\nmu\nm1\nma\nmp\nmo\nmu\nm3\nmo\nmu\nm3\nma\nmo\n' | remote_pyaal --simulation-cache $size nestedwrites.aal > nestedsim$size.out 2>>$LOGFILE || {
+        echo "failed because remote_pyaal --simulation-cache $size nestedwrites.aal failed" >>$LOGFILE
+        testfailed
+    }
+done
+if ! diff -u nestedsim0.out nestedsim100.out >>$LOGFILE 2>&1; then
+    echo "failed because simulation cache replayed bodies that write in nested code or to untracked globals" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal tag cache with nested code"
+for size in 0 100; do
+    printf 'mr\nmp\nmu\nm1\nmp\nm1\nmp\nmo\nmp\nmu\nm1\nm1\nmp\nmo\n' | remote_pyaal --tag-cache $size nestedwrites.aal > nestedtags$size.out 2>>$LOGFILE || {
+        echo "failed because remote_pyaal --tag-cache $size nestedwrites.aal failed" >>$LOGFILE
+        testfailed
+    }
+done
+if ! diff -u nestedtags0.out nestedtags100.out >>$LOGFILE 2>&1; then
+    echo "failed because tag cache returned stale tags after writes in nested code" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal state fingerprints with nested code"
+remote_pyaal --lsts-full-states -o nestedstates-full.lsts --lsts-depth 6 nestedwrites.aal >>$LOGFILE 2>&1 &&
+remote_pyaal -o nestedstates.lsts --lsts-depth 6 nestedwrites.aal >>$LOGFILE 2>&1 || {
+    echo "failed because remote_pyaal -o nestedwrites.aal failed" >>$LOGFILE
+    testfailed
+}
+if ! diff -u nestedstates-full.lsts nestedstates.lsts >>$LOGFILE 2>&1; then
+    echo "failed because state fingerprints merged states that differ in variables written in nested code" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal waiting for outputs"
+TIMEFORMAT="%U %S"
+{ time (printf 'ai\naob\n' | remote_pyaal -t 2 observe.aal > observe.out 2>>$LOGFILE) ; } 2> observe.time || {
+    echo "failed because remote_pyaal observe.aal failed" >>$LOGFILE
+    testfailed
+}
+# waiting for 2 seconds should take clearly less than a second of CPU time
+cat observe.time >>$LOGFILE
+if [ "$(tail -n 1 observe.out)" != "fmbtmagic -3" ] ||
+   ! awk '{if ($1 + $2 >= 1.0) exit 1}' observe.time; then
+    echo "failed because remote_pyaal did not wait for outputs without busy looping" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal lsts cache with changed globals"
+rm -f lstsglobals.cache
+LSTSCACHE_LIMIT=2 remote_pyaal --lsts-cache lstsglobals.cache -o lstsglobals1.lsts --lsts-depth 5 lstscache.aal >>$LOGFILE 2>&1 &&
+LSTSCACHE_LIMIT=3 remote_pyaal --lsts-cache lstsglobals.cache -o lstsglobals2.lsts --lsts-depth 5 lstscache.aal >>$LOGFILE 2>&1 &&
+LSTSCACHE_LIMIT=3 remote_pyaal -o lstsglobals3.lsts --lsts-depth 5 lstscache.aal >>$LOGFILE 2>&1 || {
+    echo "failed because remote_pyaal --lsts-cache lstscache.aal failed" >>$LOGFILE
+    testfailed
+}
+if ! diff -u lstsglobals3.lsts lstsglobals2.lsts >>$LOGFILE 2>&1; then
+    echo "failed because lsts cache missed a change in a dict read by a guard" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "remote_pyaal lsts output appended to a file"
+echo "# appended lsts" > appended.lsts
+remote_pyaal -o - --lsts-depth 5 test1.py.aal 2>>$LOGFILE | cat > piped.lsts &&
+remote_pyaal -o - --lsts-depth 5 test1.py.aal >>appended.lsts 2>>$LOGFILE || {
+    echo "failed because remote_pyaal -o - test1.py.aal failed" >>$LOGFILE
+    testfailed
+}
+if ! (echo "# appended lsts"; cat piped.lsts) | diff -u - appended.lsts >>$LOGFILE 2>&1; then
+    echo "failed because lsts output appended to a file differs from piped output" >>$LOGFILE
+    testfailed
+fi
+testpassed
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# fMBT, free Model Based Testing tool
+# Copyright (c) 2013, Intel Corporation.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU Lesser General Public License,
+# version 2.1, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+# more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin St - Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Usage: aal2lsts.py [options]
+
+Measures time and peak memory of converting synthetic AAL/Python
+models to LSTS with remote_pyaal -o. A model with v variables and
+counter range r has up to r**v states. By default models with 10**5 and
+10**6 states are converted.
+
+Options:
+    -a actions       number of actions (default: 10)
+    -r range         counter range (default: 10)
+    -v variables     comma-separated numbers of variables (default: 5,6)
+    -j jobs          pass --jobs to remote_pyaal (default: 1)
+    -k               keep generated models and LSTS files
+"""
+
+import getopt
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthmodel
+
+remote_pyaal = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "..", "utils", "remote_pyaal")
+
+# Run a command and print peak RSS of its process tree in kilobytes.
+measure_rss = """
+import resource, subprocess, sys
+status = subprocess.call(sys.argv[1:])
+print resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+sys.exit(status)
+"""
+
+def header_count(lsts_filename, field):
+    for line in file(lsts_filename):
+        if line.strip().startswith(field):
+            return int(line.split("=")[1].strip(" ;\n"))
+        if line.startswith("End Header"):
+            return None
+
+if __name__ == "__main__":
+    opt_actions = 10
+    opt_range = 10
+    opt_variables = [5, 6]
+    opt_jobs = 1
+    opt_keep = False
+    opts, remainder = getopt.getopt(sys.argv[1:], "a:r:v:j:kh")
+    for opt, arg in opts:
+        if opt == "-a": opt_actions = int(arg)
+        elif opt == "-r": opt_range = int(arg)
+        elif opt == "-v": opt_variables = [int(v) for v in arg.split(",")]
+        elif opt == "-j": opt_jobs = int(arg)
+        elif opt == "-k": opt_keep = True
+        elif opt == "-h":
+            print __doc__
+            sys.exit(0)
+
+    workdir = tempfile.mkdtemp(prefix="aal2lsts-benchmark.")
+    print "%10s %12s %10s %12s" % ("states", "transitions", "time (s)", "peak RSS (MB)")
+    try:
+        for variables in opt_variables:
+            model_filename = os.path.join(workdir, "synth%s.py" % (variables,))
+            lsts_filename = os.path.join(workdir, "synth%s.lsts" % (variables,))
+            file(model_filename, "w").write(synthmodel.generate(
+                actions=opt_actions, variables=variables, size=1,
+                counter_range=opt_range))
+            cmd = [sys.executable, "-c", measure_rss,
+                   sys.executable, remote_pyaal, "--jobs", str(opt_jobs),
+                   "--lsts-depth", str(variables * opt_range + 1),
+                   "-o", lsts_filename, model_filename]
+            start_time = time.time()
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+            peak_rss_kb = int(p.communicate()[0].strip().splitlines()[-1])
+            elapsed = time.time() - start_time
+            if p.returncode != 0:
+                print "remote_pyaal failed with exit status %s" % (p.returncode,)
+                sys.exit(1)
+            print "%10s %12s %10.1f %12.1f" % (
+                header_count(lsts_filename, "State_cnt"),
+                header_count(lsts_filename, "Transition_cnt"),
+                elapsed, peak_rss_kb / 1024.0)
+            sys.stdout.flush()
+    finally:
+        if opt_keep:
+            print "models and LSTS files are in", workdir
+        else:
+            shutil.rmtree(workdir)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# fMBT, free Model Based Testing tool
+# Copyright (c) 2013, Intel Corporation.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU Lesser General Public License,
+# version 2.1, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+# more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin St - Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Usage: pushpop.py [options]
+
+Compares AALModel push/pop with copy-on-write snapshots to the
+deepcopy based push/pop that saves every variable on every push.
+The workload resembles lookahead: from every state, push, execute
+each enabled action, evaluate guards and pop.
+
+Options:
+    -a actions       number of actions (default: 20)
+    -v variables     number of variables (default: 10)
+    -s size          payload items per variable (default: 100)
+    -r rounds        lookahead rounds (default: 2)
+"""
+
+import copy
+import getopt
+import sys
+import time
+
+import synthmodel
+
+class DeepcopyPushPop:
+    """push and pop that deepcopy all variables on every push"""
+    def push(self):
+        stack_element = {}
+        for varname in self._push_variables:
+            stack_element[varname] = copy.deepcopy(self._variables[varname])
+        if self._has_serial:
+            stack_element["!serial_abn"] = copy.deepcopy(self._serial_state())
+        self._stack.append(stack_element)
+        self._stack_executed_actions.append([])
+        self._enabled_actions_stack.append(set(self._enabled_actions_stack[-1]))
+        self._guard_cache_stack.append(dict(self._guard_cache_stack[-1]))
+
+def lookahead(model, rounds):
+    start = time.time()
+    for _ in xrange(rounds):
+        for action in model.getActions():
+            model.push()
+            model.model_execute(action)
+            for action2 in model.getActions():
+                model.push()
+                model.model_execute(action2)
+                model.pop()
+            model.pop()
+        model.model_execute(model.getActions()[0])
+    return time.time() - start
+
+if __name__ == "__main__":
+    opt_actions, opt_variables, opt_size, opt_rounds = 20, 10, 100, 2
+    opts, remainder = getopt.getopt(sys.argv[1:], "ha:v:s:r:")
+    for opt, arg in opts:
+        if opt == "-h":
+            print __doc__
+            sys.exit(0)
+        elif opt == "-a": opt_actions = int(arg)
+        elif opt == "-v": opt_variables = int(arg)
+        elif opt == "-s": opt_size = int(arg)
+        elif opt == "-r": opt_rounds = int(arg)
+
+    code = synthmodel.generate(actions=opt_actions, variables=opt_variables,
+                               size=opt_size, counter_range=1000000)
+    t_deepcopy = lookahead(synthmodel.load(code, DeepcopyPushPop), opt_rounds)
+    t_snapshot = lookahead(synthmodel.load(code), opt_rounds)
+    print "deepcopy push/pop:      %.3f s" % (t_deepcopy,)
+    print "copy-on-write push/pop: %.3f s" % (t_snapshot,)
+    print "speedup:                %.1fx" % (t_deepcopy / max(t_snapshot, 1e-9),)
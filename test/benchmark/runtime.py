@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# fMBT, free Model Based Testing tool
+# Copyright (c) 2013, Intel Corporation.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU Lesser General Public License,
+# version 2.1, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+# more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin St - Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Usage: runtime.py [options]
+
+Measures hot paths of the AAL/Python runtime on synthetic models:
+
+    getActions, getprops, push, pop, state, model_execute
+            mean seconds per call on a walk where every step
+            is preceded by a push-execute-pop lookahead of every
+            enabled action.
+
+    bridge ma, bridge mp, bridge m
+            mean seconds per protocol round trip to remote_pyaal.
+
+    aal2lsts depth d
+            seconds to convert the model to LSTS with remote_pyaal -o.
+
+Every measurement is repeated and the best result is reported. Results
+are written as JSON. If a baseline JSON file is given, results are
+compared to it, and the exit status is 1 if any result is slower than
+the baseline by more than the threshold.
+
+Options:
+    -a actions       number of actions (default: 20)
+    -v variables     number of variables (default: 5)
+    -s size          payload items per variable (default: 10)
+    -g complexity    additional terms in guards (default: 2)
+    -S serial        actions in a serial block (default: 0)
+    -d depths        comma-separated aal2lsts depths (default: 2,4)
+    -n steps         walk steps and bridge round trips (default: 200)
+    -r repeats       repeats of every measurement (default: 3)
+    -o file          write results to file (default: standard output)
+    -b baseline      compare results to baseline file
+    -t threshold     allowed slowdown, 0.2 is 20 % (default: 0.2)
+"""
+
+import getopt
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthmodel
+
+remote_pyaal = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "..", "utils", "remote_pyaal")
+
+def walk_timings(code, steps):
+    """
+    Return mean seconds per call of model methods on a walk.
+    """
+    model = synthmodel.load(code)
+    rng = random.Random(0)
+    totals = dict((name, 0.0) for name in
+                  ["getActions", "getprops", "push", "pop", "state",
+                   "model_execute"])
+    counts = dict((name, 0) for name in totals)
+    def timed(name, method, *args):
+        start = time.time()
+        rv = method(*args)
+        totals[name] += time.time() - start
+        counts[name] += 1
+        return rv
+    for step in xrange(steps):
+        actions = timed("getActions", model.getActions)
+        if not actions:
+            model.reset()
+            continue
+        timed("getprops", model.getprops)
+        timed("state", model.state)
+        for action in actions:
+            timed("push", model.push)
+            timed("model_execute", model.model_execute, action)
+            timed("pop", model.pop)
+        timed("model_execute", model.model_execute, rng.choice(actions))
+    return dict((name, totals[name] / max(counts[name], 1)) for name in totals)
+
+class Bridge(object):
+    """
+    Engine side of the aal_remote protocol with remote_pyaal.
+    """
+    def __init__(self, model_filename):
+        self._p = subprocess.Popen(
+            [sys.executable, remote_pyaal, model_filename],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.action_names = self._names()
+        self.tag_names = self._names()
+
+    def _reply(self):
+        line = self._p.stdout.readline()
+        while not line.startswith("fmbtmagic"):
+            if not line:
+                raise Exception("remote_pyaal exited")
+            line = self._p.stdout.readline()
+        return line[len("fmbtmagic "):].rstrip("\n")
+
+    def _names(self):
+        names = []
+        name = self._reply()
+        while name:
+            names.append(name)
+            name = self._reply()
+        return names
+
+    def call(self, cmd):
+        self._p.stdin.write(cmd + "\n")
+        self._p.stdin.flush()
+        return self._reply()
+
+    def close(self):
+        self._p.stdin.write("\n")
+        self._p.stdin.close()
+        self._p.wait()
+
+def bridge_timings(model_filename, steps):
+    """
+    Return mean seconds per round trip of ma, mp and m commands.
+    """
+    bridge = Bridge(model_filename)
+    rng = random.Random(0)
+    totals = {"bridge ma": 0.0, "bridge mp": 0.0, "bridge m": 0.0}
+    try:
+        bridge.call("mr")
+        for step in xrange(steps):
+            start = time.time()
+            actions = bridge.call("ma").split()
+            totals["bridge ma"] += time.time() - start
+            start = time.time()
+            bridge.call("mp")
+            totals["bridge mp"] += time.time() - start
+            if not actions:
+                bridge.call("mr")
+                actions = bridge.call("ma").split()
+            start = time.time()
+            bridge.call("m" + rng.choice(actions))
+            totals["bridge m"] += time.time() - start
+    finally:
+        bridge.close()
+    return dict((name, totals[name] / steps) for name in totals)
+
+def aal2lsts_timing(model_filename, lsts_filename, depth):
+    start = time.time()
+    subprocess.check_call([sys.executable, remote_pyaal,
+                           "--lsts-depth", str(depth),
+                           "-o", lsts_filename, model_filename])
+    return time.time() - start
+
+def best_of(repeats, measure, *args):
+    """
+    Return the best result of repeated measurements.
+    """
+    best = None
+    for _ in xrange(repeats):
+        result = measure(*args)
+        if not isinstance(result, dict):
+            result = {"": result}
+        if best == None:
+            best = result
+        else:
+            for name in result:
+                best[name] = min(best[name], result[name])
+    return best
+
+def compare(results, baseline, threshold):
+    """
+    Print results that are slower than baseline, return their number.
+    """
+    regressions = 0
+    for name in sorted(results):
+        if not name in baseline or baseline[name] <= 0:
+            continue
+        ratio = results[name] / baseline[name]
+        if ratio > 1.0 + threshold:
+            regressions += 1
+            sys.stderr.write("regression: %s %.3g s, baseline %.3g s (%+.0f %%)\n" % (
+                name, results[name], baseline[name], (ratio - 1.0) * 100))
+    return regressions
+
+if __name__ == "__main__":
+    parameters = {"actions": 20, "variables": 5, "size": 10,
+                  "guard_complexity": 2, "serial": 0}
+    opt_depths = [2, 4]
+    opt_steps = 200
+    opt_repeats = 3
+    opt_output = None
+    opt_baseline = None
+    opt_threshold = 0.2
+    opts, remainder = getopt.getopt(sys.argv[1:], "ha:v:s:g:S:d:n:r:o:b:t:")
+    for opt, arg in opts:
+        if opt == "-h":
+            print __doc__
+            sys.exit(0)
+        elif opt == "-a": parameters["actions"] = int(arg)
+        elif opt == "-v": parameters["variables"] = int(arg)
+        elif opt == "-s": parameters["size"] = int(arg)
+        elif opt == "-g": parameters["guard_complexity"] = int(arg)
+        elif opt == "-S": parameters["serial"] = int(arg)
+        elif opt == "-d": opt_depths = [int(d) for d in arg.split(",")]
+        elif opt == "-n": opt_steps = int(arg)
+        elif opt == "-r": opt_repeats = int(arg)
+        elif opt == "-o": opt_output = arg
+        elif opt == "-b": opt_baseline = arg
+        elif opt == "-t": opt_threshold = float(arg)
+
+    code = synthmodel.generate(counter_range=5, **parameters)
+    workdir = tempfile.mkdtemp(prefix="runtime-benchmark.")
+    try:
+        model_filename = os.path.join(workdir, "synth.py")
+        lsts_filename = os.path.join(workdir, "synth.lsts")
+        file(model_filename, "w").write(code)
+        results = best_of(opt_repeats, walk_timings, code, opt_steps)
+        results.update(best_of(opt_repeats, bridge_timings,
+                               model_filename, opt_steps))
+        for depth in opt_depths:
+            results["aal2lsts depth %s" % (depth,)] = best_of(
+                opt_repeats, aal2lsts_timing,
+                model_filename, lsts_filename, depth)[""]
+    finally:
+        shutil.rmtree(workdir)
+
+    report = json.dumps({"parameters": parameters, "steps": opt_steps,
+                         "results": results}, indent=4, sort_keys=True)
+    if opt_output:
+        file(opt_output, "w").write(report + "\n")
+    else:
+        print report
+
+    if opt_baseline:
+        baseline = json.load(file(opt_baseline))["results"]
+        if compare(results, baseline, opt_threshold):
+            sys.exit(1)
@@ -0,0 +1,170 @@
+# fMBT, free Model Based Testing tool
+# Copyright (c) 2013, Intel Corporation.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU Lesser General Public License,
+# version 2.1, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+# more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin St - Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Synthetic AAL/Python models for benchmarking the AAL/Python runtime.
+
+generate(...) returns Python code in the form that fmbt-aalc produces
+from AAL/Python, so benchmarks do not need fmbt-aalc. load(code)
+executes the code and returns an instance of the model.
+
+Each action increments a counter variable modulo the given range and
+appends to the payload of a variable, so the number of reachable
+states can be controlled with the counter range.
+"""
+
+import os
+import types
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "..", "utils"))
+
+import aalmodel
+
+def generate(actions=10, variables=4, size=10, counter_range=5,
+             guard_complexity=0, serial=0):
+    """
+    Return generated AAL/Python code of a model.
+
+    Parameters:
+
+      actions (integer)
+              number of input actions.
+
+      variables (integer)
+              number of counter variables, each action changes one.
+
+      size (integer)
+              number of items in the payload (a dict of lists)
+              of each variable.
+
+      counter_range (integer)
+              counters run from 0 to counter_range-1.
+
+      guard_complexity (integer)
+              number of additional terms in each guard. Every term
+              reads the payload of a different variable.
+
+      serial (integer)
+              number of actions, counted from the last one, that are
+              placed in a serial block.
+    """
+    varnames = ["v%s" % (i,) for i in xrange(variables)]
+    payloads = ["p%s" % (i,) for i in xrange(variables)]
+    glob = "        global %s\n" % (", ".join(varnames + payloads),)
+    lines = [
+        "import aalmodel",
+        "class _gen_synth(aalmodel.AALModel):",
+        "    def __init__(self):",
+        "        aalmodel.AALModel.__init__(self, globals())",
+        "    adapter_init_list = []",
+        "    initial_state_list = []",
+        "    adapter_exit_list = []",
+        "    push_variables_set = set()",
+        "",
+        "    def initial_state1():",
+        glob.rstrip()]
+    for v, p in zip(varnames, payloads):
+        lines.append("        %s = 0" % (v,))
+        lines.append("        %s = dict((str(k), range(k %% 7)) for k in xrange(%s))" % (p, size))
+    lines.extend([
+        "    initial_state_list.append(initial_state1)",
+        "    push_variables_set.update(initial_state1.func_code.co_names)"])
+    if serial:
+        lines.extend([
+            "",
+            "    serial1name = \"serial1\"",
+            "    def serial1guard():",
+            "        return _gen_synth.serial1guard_next_block[-1] == guard_list[-2]",
+            "    serial1guard.blocks = []",
+            "    serial1guard_next_block = []",
+            "    def serial1step(self, upper):",
+            "        _gen_synth.serial1guard_next_block.pop()",
+            "        if not _gen_synth.serial1guard_next_block:",
+            "            _gen_synth.serial1guard_next_block = _gen_synth.serial1guard.blocks[::-1]"])
+    for a in xrange(1, actions + 1):
+        v = varnames[a % variables]
+        p = payloads[a % variables]
+        in_serial = a > actions - serial
+        guard = "%s < %s" % (v, counter_range - 1 - (a % 2))
+        for term in xrange(guard_complexity):
+            guard += " and len(%s[%r]) >= 0" % (
+                payloads[(a + term + 1) % variables], str(term % max(size, 1)))
+        lines.extend([
+            "",
+            "    action%sname = \"iAction%s\"" % (a, a),
+            "    action%stype = \"input\"" % (a,)])
+        if in_serial:
+            lines.extend([
+                "    serial1guard.blocks.append(\"iAction%s\")" % (a,),
+                "    serial1guard_next_block.insert(0, \"iAction%s\")" % (a,)])
+        lines.extend([
+            "    def action%sguard():" % (a,),
+            glob.rstrip(),
+            "        return %s" % (guard,),
+            "    action%sguard.requires = []" % (a,)])
+        if in_serial:
+            lines.append("    action%sguard.requires += [\"serial1guard\"]" % (a,))
+        lines.extend([
+            "    def action%sbody():" % (a,),
+            glob.rstrip(),
+            "        %s = (%s + 1) %% %s" % (v, v, counter_range),
+            "        %s['0'].append(%s)" % (p, v),
+            "        if len(%s['0']) > 3: %s['0'] = []" % (p, p)])
+        if in_serial:
+            lines.append("    action%sbody_postcall = [\"serial1step\"]" % (a,))
+        lines.extend([
+            "    def action%sadapter():" % (a,),
+            glob.rstrip(),
+            "        return %s" % (a,)])
+    lines.extend([
+        "",
+        "    tag1name = \"tFirstZero\"",
+        "    def tag1guard():",
+        glob.rstrip(),
+        "        return %s == 0" % (varnames[0],),
+        "    tag1guard.requires = []",
+        "",
+        "    def adapter_init():",
+        "        return True",
+        "    def initial_state():",
+        "        for x in _gen_synth.initial_state_list:",
+        "            x()",
+        "        return True",
+        "    def adapter_exit(verdict, reason):",
+        "        return True",
+        "",
+        "Model = _gen_synth",
+        ""])
+    return "\n".join(lines)
+
+def load(code, model_class=None):
+    """
+    Execute generated code and return a reset instance of the model.
+    If model_class is given, it is used as a mixin before the
+    generated model class.
+    """
+    model_globals = {"__name__": "synthmodel_generated"}
+    exec compile(code, "<synthetic model>", "exec") in model_globals
+    cls = model_globals["Model"]
+    if model_class:
+        cls = types.ClassType(cls.__name__, (model_class, cls), {})
+    model = cls()
+    model._log = lambda msg: None
+    model.timeout = 0.0
+    model.reset()
+    return model
@@ -118,3 +118,27 @@ if [[ $DEEP_INITIAL_COV > $QUICK_INITIAL_COV ]]; then
 else
     testfailed
 fi
+
+teststep "fmbt-stats: compressed log and output"
+fmbt-log quick.log > quick.log.txt
+fmbt-stats -f times -o quick-times.csv quick.log >>$LOGFILE 2>&1
+for compress in gzip bzip2 xz; do
+    case $compress in
+        gzip) suffix=gz ;;
+        bzip2) suffix=bz2 ;;
+        xz) suffix=xz
+            if ! which xz >/dev/null 2>&1 ||
+               ! PYTHONPATH=../../utils:$PYTHONPATH python -c 'import fmbtcompress; fmbtcompress._lzma()' >/dev/null 2>&1; then
+                echo "xz or Python lzma module not installed, skipping xz" >>$LOGFILE
+                continue
+            fi ;;
+    esac
+    $compress -c quick.log > quick.log.$suffix
+    fmbt-log quick.log.$suffix > quick.log.$suffix.txt
+    fmbt-stats -f times -o quick-times.csv.$suffix quick.log.$suffix >>$LOGFILE 2>&1
+    ( diff -u quick.log.txt quick.log.$suffix.txt &&
+      $compress -dc quick-times.csv.$suffix | diff -u quick-times.csv - ) >>$LOGFILE 2>&1 || {
+        testfailed
+    }
+done
+testpassed
@@ -0,0 +1,215 @@
+#!/bin/bash
+
+# fMBT, free Model Based Testing tool
+# Copyright (c) 2011, Intel Corporation.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU Lesser General Public License,
+# version 2.1, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+# more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin St - Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# This test tests reading and writing LSTS files with lsts.py
+
+##########################################
+# Setup test environment
+
+cd "$(dirname "$0")"
+LOGFILE=/tmp/fmbt.test.lsts.log
+rm -f $LOGFILE
+
+if [ "$1" != "installed" ]; then
+    export PATH=../../src:../../utils:$PATH
+    export PYTHONPATH=../../utils:$PYTHONPATH
+fi
+
+source ../functions.sh
+
+##########################################
+# Run the test
+
+teststep "lsts: write state propositions as ranges"
+python - >>$LOGFILE 2>&1 <<EOF
+import lsts
+states = 50
+w = lsts.writer(file("ring.lsts", "w"))
+w.set_actionnames(["tau", "iNext", "iBack"])
+w.set_transitions([[((s + 1) % states, 1), ((s - 1) % states, 2)]
+                   for s in xrange(states)])
+w.set_stateprops({"low": range(20),
+                  "even": range(0, states, 2),
+                  "all": range(states),
+                  "last": [states - 1]})
+w.write()
+EOF
+if ! grep -q '"all" : 1\.\.50;' ring.lsts ||
+   ! grep -q '"low" : 1\.\.20;' ring.lsts ||
+   ! grep -q '"even" : 1 3 5 .* 49;' ring.lsts; then
+    cat ring.lsts >>$LOGFILE
+    echo "failed because state propositions were not written as expected" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "lsts: read state proposition ranges"
+cat > ranges.lsts <<EOF
+Begin Lsts
+
+Begin Header
+ State_cnt = 10
+ Action_cnt = 1
+ Transition_cnt = 1
+ State_prop_cnt = 3
+ Initial_states = 1;
+End Header
+
+Begin Action_names
+ 1 = "iStep"
+End Action_names
+
+Begin Transitions
+ 1: 2,1;
+End Transitions
+
+Begin State_props
+  "mixed" : 2..4 7 9..10;
+  "range" : 1..10;
+  "single" : 5;
+End State_props
+
+End Lsts
+EOF
+python - > ranges.txt 2>>$LOGFILE <<EOF
+import lsts
+props = lsts.reader(file("ranges.lsts")).get_stateprops()
+for name in sorted(props):
+    print name, sorted(props[name])
+EOF
+cat > ranges.expected <<EOF
+mixed [1, 2, 3, 6, 8, 9]
+range [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+single [4]
+EOF
+if ! diff -u ranges.expected ranges.txt >>$LOGFILE 2>&1; then
+    echo "failed because state proposition ranges were read incorrectly" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "lsts: text to lstsb to text"
+python -c 'import sys, lsts; lsts.writer(sys.stdout, lsts.reader(sys.stdin))' < ring.lsts > ring-text.lsts 2>>$LOGFILE &&
+python -c 'import sys, lsts; lsts.writer(lsts_object=lsts.reader(sys.stdin)).write_lstsb(sys.stdout)' < ring.lsts > ring.lstsb 2>>$LOGFILE &&
+python -c 'import sys, lsts; lsts.writer(sys.stdout, lsts.reader(sys.stdin))' < ring.lstsb > ring-lstsb.lsts 2>>$LOGFILE || {
+    echo "failed because converting between lsts and lstsb failed" >>$LOGFILE
+    testfailed
+}
+if grep -q "Begin Lsts" ring.lstsb; then
+    echo "failed because ring.lstsb is not in binary format" >>$LOGFILE
+    testfailed
+fi
+if ! diff -u ring-text.lsts ring-lstsb.lsts >>$LOGFILE 2>&1; then
+    echo "failed because lsts changed in conversion to lstsb and back" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "lsts: compressed input and output of lsts2dot"
+lsts2dot -i ring.lsts -o ring.dot >>$LOGFILE 2>&1 || {
+    echo "failed because lsts2dot -i ring.lsts failed" >>$LOGFILE
+    testfailed
+}
+for compress in gzip bzip2 xz; do
+    case $compress in
+        gzip) suffix=gz ;;
+        bzip2) suffix=bz2 ;;
+        xz) suffix=xz
+            if ! which xz >/dev/null 2>&1 ||
+               ! python -c 'import fmbtcompress; fmbtcompress._lzma()' >/dev/null 2>&1; then
+                echo "xz or Python lzma module not installed, skipping xz" >>$LOGFILE
+                continue
+            fi ;;
+    esac
+    for input in ring.lsts ring.lstsb; do
+        $compress -c $input > $input.$suffix
+        lsts2dot -i $input.$suffix -o $input.dot.$suffix >>$LOGFILE 2>&1 || {
+            echo "failed because lsts2dot -i $input.$suffix failed" >>$LOGFILE
+            testfailed
+        }
+        if ! $compress -dc $input.dot.$suffix | diff -u ring.dot - >>$LOGFILE 2>&1; then
+            echo "failed because lsts2dot output from $input.$suffix differs" >>$LOGFILE
+            testfailed
+        fi
+    done
+done
+testpassed
+
+teststep "lsts: read unselected sections on first access"
+gzip -c ring.lsts > ring-lazy.lsts.gz
+python - > lazy.txt 2>>$LOGFILE <<EOF
+import lsts
+def contents(r):
+    return (r.get_actionnames(), sorted(r.get_stateprops().items()),
+            [list(t) for t in r.get_transitions()], r.get_layout())
+full = contents(lsts.reader(file("ring.lsts")))
+for filename in ["ring.lsts", "ring.lstsb", "ring-lazy.lsts.gz"]:
+    r = lsts.reader(file(filename), sections=("header", "action_names"))
+    print filename, r.get_header().state_cnt, r.get_actionnames()
+    # state propositions are after transitions in the file
+    props = sorted(r.get_stateprops().items())
+    print filename, props == full[1] and contents(r) == full
+EOF
+cat ring.lsts | python -c '
+import sys, lsts
+r = lsts.reader(sys.stdin, sections=("header", "action_names"))
+print "stdin", r.get_header().state_cnt, r.get_actionnames()
+print "stdin", sorted(r.get_stateprops()["last"]), list(r.get_transitions()[49])
+' >> lazy.txt 2>>$LOGFILE
+cat > lazy.expected <<EOF
+ring.lsts 50 ['tau', 'iNext', 'iBack']
+ring.lsts True
+ring.lstsb 50 ['tau', 'iNext', 'iBack']
+ring.lstsb True
+ring-lazy.lsts.gz 50 ['tau', 'iNext', 'iBack']
+ring-lazy.lsts.gz True
+stdin 50 ['tau', 'iNext', 'iBack']
+stdin [49] [(0, 1), (48, 2)]
+EOF
+if ! diff -u lazy.expected lazy.txt >>$LOGFILE 2>&1; then
+    echo "failed because sections read on first access differ from fully read lsts" >>$LOGFILE
+    testfailed
+fi
+testpassed
+
+teststep "lsts: transitions cannot be modified in place"
+python - > readonly.txt 2>>$LOGFILE <<EOF
+import lsts
+transitions = lsts.reader(file("ring.lsts")).get_transitions()
+for modify in [lambda: transitions.__setitem__(0, []),
+               lambda: transitions.__delitem__(0),
+               lambda: transitions[0].append((1, 1))]:
+    try:
+        modify()
+        print "modified"
+    except (TypeError, AttributeError), e:
+        print type(e).__name__
+print transitions[0], transitions == [[(1, 1), (49, 2)]] + list(transitions)[1:]
+EOF
+cat > readonly.expected <<EOF
+TypeError
+TypeError
+AttributeError
+((1, 1), (49, 2)) True
+EOF
+if ! diff -u readonly.expected readonly.txt >>$LOGFILE 2>&1; then
+    echo "failed because transitions were modified in place" >>$LOGFILE
+    testfailed
+fi
+testpassed
@@ -1,4 +1,11 @@
+import collections
 import copy
+import cPickle
+import hashlib
+import math
+import opcode
+import re
+import select
 import types
 import time
 import traceback
@@ -6,6 +13,77 @@ import fmbt
 
 SILENCE = -3
 
+# Default poll interval of outputs in observe(), and the limit of
+# backing off outputs that keep returning nothing.
+_OBSERVE_INTERVAL = 0.01
+_OBSERVE_MAX_BACKOFF = 16
+
+# Profiling, see AALModel.set_profiling()
+_PROFILED_METHODS = ["adapter_execute", "model_execute", "tag_execute", "observe"]
+_PROFILE_BUCKETS = 32
+_BLOCK_NAME = re.compile("^([a-z_]+?)[0-9]+([a-z_]+)$")
+
+# The tag cache, see AALModel.set_tag_cache(), is used only if it
+# saves time on the first _TAG_CACHE_TRIAL calls of getprops().
+_TAG_CACHE_TRIAL = 32
+
+# Types of values that guards may read without making them volatile.
+_CONSTANT_TYPES = (int, long, float, bool, str, unicode, tuple, frozenset,
+                   types.NoneType, types.BuiltinFunctionType)
+
+# Opcodes that assign or delete global variables.
+_GLOBAL_STORES = (opcode.opmap["STORE_GLOBAL"], opcode.opmap["DELETE_GLOBAL"])
+
+# Types of values that can be shared between the model and its stack.
+_ATOMIC_TYPES = (int, long, float, bool, str, unicode, types.NoneType)
+
+def _snapshot_value(value):
+    """
+    Return a copy of value that shares no mutable parts with it.
+    """
+    if type(value) in _ATOMIC_TYPES:
+        return value
+    try:
+        return cPickle.loads(cPickle.dumps(value, 2))
+    except Exception:
+        return copy.deepcopy(value)
+
+def _code_names(code):
+    """
+    Return global and attribute names used in code, including code
+    of lambdas, generator expressions and functions nested in it.
+    """
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names.update(_code_names(const))
+    return names
+
+def _stored_globals(code):
+    """
+    Return names of global variables that code, or code nested in
+    it, assigns or deletes.
+    """
+    names = set()
+    co_code = code.co_code
+    pos, extended_arg = 0, 0
+    while pos < len(co_code):
+        op = ord(co_code[pos])
+        if op < opcode.HAVE_ARGUMENT:
+            pos += 1
+            continue
+        arg = ord(co_code[pos+1]) + ord(co_code[pos+2]) * 256 + extended_arg
+        extended_arg = 0
+        pos += 3
+        if op == opcode.EXTENDED_ARG:
+            extended_arg = arg * 65536
+        elif op in _GLOBAL_STORES:
+            names.add(code.co_names[arg])
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names.update(_stored_globals(const))
+    return names
+
 def setCodeFileLine(c, filename, lineno, funcname=None):
     if funcname == None:
         funcname = c.co_name
@@ -14,20 +92,59 @@ def setCodeFileLine(c, filename, lineno, funcname=None):
         c.co_code, c.co_consts, c.co_names, c.co_varnames,
         filename, funcname, lineno, c.co_lnotab, c.co_freevars)
 
+class ActionTable:
+    """
+    Actions, tags and serial blocks of an AAL model, discovered once
+    when the model is constructed. Indices are zero-based, action
+    number i is index i-1.
+
+    input_indices and output_indices list indices of input and output
+    actions in order. input_guards and output_guards are the guards
+    of those actions, guard_codes and adapter_codes the code objects
+    of all guards and adapters. serial_slots are names of class
+    attributes that hold the next blocks of serial blocks.
+    """
+    def __init__(self, model):
+        def get_all(property_name, itemtype):
+            plist = []
+            i = 1
+            while 1:
+                try: plist.append(getattr(model, itemtype + str(i) + property_name))
+                except AttributeError: return plist
+                i += 1
+        self.names = get_all("name", "action")
+        self.types = get_all("type", "action")
+        self.guards = get_all("guard", "action")
+        self.bodies = get_all("body", "action")
+        self.adapters = get_all("adapter", "action")
+        self.guard_codes = [guard.func_code for guard in self.guards]
+        self.adapter_codes = [adapter.func_code for adapter in self.adapters]
+        self.input_indices = [index for index, t in enumerate(self.types)
+                              if t == "input"]
+        self.output_indices = [index for index, t in enumerate(self.types)
+                               if t == "output"]
+        self.input_guards = [self.guards[index] for index in self.input_indices]
+        self.output_guards = [self.guards[index] for index in self.output_indices]
+        self.tag_names = get_all("name", "tag")
+        self.tag_guards = get_all("guard", "tag")
+        self.tag_adapters = get_all("adapter", "tag")
+        self.serial_slots = []
+        while hasattr(model, "serial%sguard_next_block" % (len(self.serial_slots) + 1,)):
+            self.serial_slots.append("serial%sguard_next_block" % (len(self.serial_slots) + 1,))
+
 class AALModel:
     def __init__(self, model_globals):
-        self._all_guards = self._get_all("guard", "action")
-        self._all_bodies = self._get_all("body", "action")
-        self._all_adapters = self._get_all("adapter", "action")
-        self._all_names = self._get_all("name", "action")
-        self._all_types = self._get_all("type", "action")
-        self._all_tagnames = self._get_all("name", "tag")
-        self._all_tagguards = self._get_all("guard", "tag")
-        self._all_tagadapters = self._get_all("adapter", "tag")
-        if len(self._get_all("guard_next_block", "serial")) > 0:
-            self._has_serial = True
-        else:
-            self._has_serial = False
+        self._action_table = ActionTable(self)
+        self._all_guards = self._action_table.guards
+        self._all_bodies = self._action_table.bodies
+        self._all_adapters = self._action_table.adapters
+        self._all_names = self._action_table.names
+        self._all_types = self._action_table.types
+        self._all_tagnames = self._action_table.tag_names
+        self._all_tagguards = self._action_table.tag_guards
+        self._all_tagadapters = self._action_table.tag_adapters
+        self._serial_slots = self._action_table.serial_slots
+        self._has_serial = len(self._serial_slots) > 0
         self._variables = model_globals
         self._variables['action'] = lambda name: self._all_names.index(name) + 1
         self._variables['name'] = lambda name: self._all_names.index(name)
@@ -38,26 +155,37 @@ class AALModel:
         self._stack_executed_actions = []
         self._adapter_exit_executed = False
         self._enabled_actions_stack = [set()]
+        self._incremental_guards = False
+        self._guard_cache_stack = [{}]
+        self._guard_deps = {}
+        self._body_writes = {}
+        self._var_guards = {}
+        self._var_digests = {}
+        self._sim_cache = None
+        self._sim_cache_size = 0
+        self._sim_cache_guards = False
+        self._sim_cache_tags = False
+        self._tag_cache = None
+        self._tag_cache_size = 0
+        self._tag_cache_trial = None
+        self._profile = {}
+        self._profile_filename = None
         fmbt._g_testStep = 0
 
-    def _get_all(self, property_name, itemtype):
-        plist = []
-        i = 1
-        while 1:
-            try: plist.append(getattr(self, itemtype + str(i) + property_name))
-            except: return plist
-            i += 1
+    def action_table(self):
+        """
+        Return ActionTable of the model.
+        """
+        return self._action_table
 
-    def _set_all_class(self, property_name, itemtype, value_array):
-        i = 1
+    def _serial_state(self):
         cls = self.__class__
-        while 1:
-            itemname = itemtype + str(i) + property_name
-            if hasattr(cls, itemname):
-                setattr(cls, itemname, value_array[i-1])
-            else:
-                return
-            i += 1
+        return [getattr(cls, slot) for slot in self._serial_slots]
+
+    def _set_serial_state(self, value_array):
+        cls = self.__class__
+        for slot, value in zip(self._serial_slots, value_array):
+            setattr(cls, slot, value)
 
     def call(self, func, call_arguments = ()):
         guard_list = None
@@ -110,6 +238,7 @@ class AALModel:
 
     def reset(self):
         # initialize model
+        self._save_variables(None)
         fmbt._g_actionName = "AAL: initial_state"
         rv = self.call(self.initial_state)
         self._push_variables = [
@@ -117,15 +246,320 @@ class AALModel:
             if (v in self._variables and
                 type(eval(v, self._variables)) not in [types.ModuleType, types.ClassType])
             ]
+        self._analyse_dependencies()
+        self._variables_changed(None)
+        self._clear_simulation_cache()
         return rv
 
+    def set_incremental_guards(self, enabled):
+        """
+        Enable or disable incremental guard evaluation. When enabled,
+        a guard is evaluated again only if a body has written a model
+        variable that the guard reads. Guards are assumed to be pure
+        functions of model variables. Guards that read modules,
+        functions or other non-constant globals are always evaluated.
+        """
+        self._incremental_guards = enabled
+        self._guard_cache_stack = [{} for _ in self._guard_cache_stack]
+
+    def set_profiling(self, enabled, filename=None):
+        """
+        Enable or disable measuring time spent in blocks of the model
+        and in adapter_execute, model_execute, tag_execute and observe.
+        If filename is given, profile_report() is written to it on
+        aexit(). Disabled profiling has no overhead: instrumented
+        methods are replaced by the original ones.
+        """
+        self._profile = {}
+        self._profile_filename = filename
+        for method_name in _PROFILED_METHODS:
+            self.__dict__.pop(method_name, None)
+        self.__dict__.pop("call", None)
+        if enabled:
+            for method_name in _PROFILED_METHODS:
+                self.__dict__[method_name] = self._profiled_method(method_name)
+            self.call = self._profiled_call
+
+    def _profiled_method(self, method_name):
+        method = getattr(self.__class__, method_name)
+        if method_name == "tag_execute":
+            names = self._all_tagnames
+        else:
+            names = self._all_names
+        def profiled(i, *args):
+            start_time = time.time()
+            try:
+                return method(self, i, *args)
+            finally:
+                if method_name == "observe": name = ""
+                elif 0 < i <= len(names): name = names[i-1]
+                else: name = str(i)
+                self._profile_record(method_name, name, time.time() - start_time)
+        return profiled
+
+    def _profiled_call(self, func, call_arguments = ()):
+        start_time = time.time()
+        try:
+            return AALModel.call(self, func, call_arguments)
+        finally:
+            # action3guard -> guard, tag1guard -> tag guard
+            m = _BLOCK_NAME.match(func.__name__)
+            if not m: block = func.__name__
+            elif m.group(1) == "action": block = m.group(2)
+            else: block = m.group(1) + " " + m.group(2)
+            self._profile_record(block, fmbt._g_actionName, time.time() - start_time)
+
+    def _profile_record(self, block, name, seconds):
+        try:
+            stats = self._profile[(block, name)]
+        except KeyError:
+            stats = self._profile[(block, name)] = [0, 0.0, 0.0, [0] * _PROFILE_BUCKETS]
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]: stats[2] = seconds
+        # bucket b counts times in [2**(b-1), 2**b) microseconds
+        bucket = math.frexp(seconds * 1000000)[1]
+        stats[3][min(max(bucket, 0), _PROFILE_BUCKETS - 1)] += 1
+
+    def profile_report(self):
+        """
+        Return measured times as tab separated lines: block type,
+        action or tag name, count, total and max seconds, and
+        histogram. Item b in the histogram is the number of times in
+        [2**(b-1), 2**b) microseconds. Name "*" sums up all names.
+        """
+        totals = {}
+        for (block, name), (count, total, max_time, histogram) in self._profile.items():
+            stats = totals.setdefault((block, "*"), [0, 0.0, 0.0, [0] * _PROFILE_BUCKETS])
+            stats[0] += count
+            stats[1] += total
+            stats[2] = max(stats[2], max_time)
+            stats[3] = [a + b for a, b in zip(stats[3], histogram)]
+        lines = ["# block\tname\tcount\ttotal\tmax\thistogram"]
+        for (block, name), (count, total, max_time, histogram) in sorted(
+                self._profile.items() + totals.items()):
+            while histogram and histogram[-1] == 0:
+                histogram = histogram[:-1]
+            lines.append("%s\t%s\t%s\t%.6f\t%.6f\t%s" % (
+                block, name, count, total, max_time,
+                " ".join([str(c) for c in histogram])))
+        return "\n".join(lines) + "\n"
+
+    def write_profile(self, filename):
+        file(filename, "w").write(self.profile_report())
+
+    def set_simulation_cache(self, max_entries):
+        """
+        Enable memoizing simulated actions when max_entries > 0,
+        otherwise disable it. When enabled, executing an action when
+        the model is pushed and the action has been executed in the
+        same state before restores the variables that the body wrote
+        instead of executing the body. Enabled actions of states are
+        memoized, too. At most max_entries results are kept, least
+        recently used results are dropped first.
+
+        Actions whose bodies read modules, functions or other
+        non-constant globals are never memoized, nor are enabled
+        actions if a guard reads them. A model can opt out by setting
+        global variable simulation_cache to False.
+        """
+        if max_entries > 0 and self._variables.get("simulation_cache", True):
+            self._sim_cache = collections.OrderedDict()
+            self._sim_cache_size = max_entries
+        else:
+            self._sim_cache = None
+            self._sim_cache_size = 0
+
+    def _clear_simulation_cache(self):
+        if self._sim_cache is not None:
+            self._sim_cache.clear()
+
+    def set_tag_cache(self, max_entries):
+        """
+        Memoize enabled tags of at most max_entries states when
+        max_entries > 0, otherwise evaluate tag guards on every
+        getprops(), which is the default. Least recently used
+        states are dropped first.
+        Memoized tags are kept over reset() but not over init().
+
+        Computing the state fingerprint for the cache lookup may take
+        longer than evaluating cheap tag guards. Therefore the first
+        calls of getprops() measure both, and the cache is dropped if
+        it would not save time. Tags are not memoized if a tag guard
+        reads modules, functions or other non-constant globals. A
+        model whose tag guards read external state in other ways can
+        opt out by setting global variable tag_cache to False.
+        """
+        if max_entries > 0 and self._variables.get("tag_cache", True):
+            self._tag_cache = collections.OrderedDict()
+            self._tag_cache_size = max_entries
+            # calls, misses, fingerprint seconds, evaluation seconds
+            self._tag_cache_trial = [0, 0, 0.0, 0.0]
+        else:
+            self._tag_cache = None
+            self._tag_cache_size = 0
+            self._tag_cache_trial = None
+
+    def _tag_cache_measured(self, fingerprint_seconds, evaluation_seconds):
+        trial = self._tag_cache_trial
+        trial[0] += 1
+        trial[2] += fingerprint_seconds
+        if evaluation_seconds != None:
+            trial[1] += 1
+            trial[3] += evaluation_seconds
+        if trial[0] < _TAG_CACHE_TRIAL:
+            return
+        self._tag_cache_trial = None
+        calls, misses, fingerprint_seconds, evaluation_seconds = trial
+        if fingerprint_seconds + evaluation_seconds >= calls * evaluation_seconds / misses:
+            self._tag_cache = None
+
+    def _sim_cache_get(self, key):
+        try:
+            value = self._sim_cache.pop(key)
+        except KeyError:
+            return None
+        self._sim_cache[key] = value
+        return value
+
+    def _sim_cache_put(self, key, value):
+        self._sim_cache[key] = value
+        if len(self._sim_cache) > self._sim_cache_size:
+            self._sim_cache.popitem(last=False)
+
+    def _analyse_dependencies(self):
+        """
+        Find out which model variables each action guard reads and
+        each action body writes, based on names used in their code.
+        """
+        tracked = set(self._push_variables)
+        action_helper = self._variables['action']
+        name_helper = self._variables['name']
+
+        def names_of(func):
+            names = _code_names(func.func_code)
+            for prerequire in getattr(func, "requires", []):
+                names.update(names_of(getattr(self, prerequire)))
+            return names
+
+        # Untracked globals that blocks assign change without the
+        # model knowing it, whatever their current value is.
+        stored = set()
+        for func in self._all_bodies + self._all_adapters + self._all_tagadapters:
+            stored.update(_stored_globals(func.func_code))
+        stored -= tracked
+
+        def is_volatile(name):
+            if name in tracked:
+                return False
+            if name in stored:
+                return True
+            if not name in self._variables:
+                return False
+            value = self._variables[name]
+            return not (isinstance(value, _CONSTANT_TYPES) or
+                        value is action_helper or value is name_helper)
+
+        self._guard_deps = {}
+        self._var_guards = {}
+        for index, guard in enumerate(self._all_guards):
+            names = names_of(guard)
+            if [n for n in names if is_volatile(n)]:
+                continue # volatile: always evaluate
+            self._guard_deps[index] = names & tracked
+            for varname in self._guard_deps[index]:
+                self._var_guards.setdefault(varname, []).append(index)
+
+        self._body_writes = {}
+        for index, body in enumerate(self._all_bodies):
+            names = _code_names(body.func_code)
+            if [n for n in names if is_volatile(n)]:
+                # may write anything, including untracked globals: save
+                # all variables on push and never replay from the cache
+                self._body_writes[index] = None
+            else:
+                self._body_writes[index] = sorted(names & tracked)
+
+        # Serial blocks are part of the state, their guards can be
+        # memoized even though they read the model class and guard_list.
+        def is_volatile_in_state(name):
+            if name == "guard_list": return False
+            value = self._variables.get(name, None)
+            if isinstance(value, types.ClassType) and isinstance(self, value):
+                return False
+            return is_volatile(name)
+
+        self._sim_cache_guards = True
+        for guard in self._all_guards:
+            if [n for n in names_of(guard) if is_volatile_in_state(n)]:
+                self._sim_cache_guards = False
+        self._sim_cache_tags = True
+        for guard in self._all_tagguards:
+            if [n for n in names_of(guard) if is_volatile_in_state(n)]:
+                self._sim_cache_tags = False
+
+    def _variables_changed(self, varnames):
+        """
+        Forget cached guard results and state digests that depend on
+        any of varnames. If varnames is None, forget everything.
+        """
+        cache = self._guard_cache_stack[-1]
+        if varnames == None:
+            cache.clear()
+            self._var_digests.clear()
+            return
+        for varname in varnames:
+            self._var_digests.pop(varname, None)
+            for index in self._var_guards.get(varname, ()):
+                cache.pop(index, None)
+
+    def _save_variables(self, varnames, serial=False):
+        """
+        Save current values of varnames to the topmost stack element
+        unless they have been saved there already. If varnames is
+        None, save all push variables and the state of serial blocks.
+        This must be called before anything writes model variables.
+        """
+        if not self._stack:
+            return
+        stack_element = self._stack[-1]
+        if varnames == None:
+            varnames = self._push_variables
+            serial = self._has_serial
+        saved_digests = stack_element.setdefault("!digests", {})
+        for varname in varnames:
+            if not varname in stack_element:
+                stack_element[varname] = _snapshot_value(self._variables[varname])
+                if varname in self._var_digests:
+                    saved_digests[varname] = self._var_digests[varname]
+        if serial and not "!serial_abn" in stack_element:
+            stack_element["!serial_abn"] = copy.deepcopy(self._serial_state())
+
+    def _guard(self, index):
+        fmbt._g_actionName = self._all_names[index]
+        if not self._incremental_guards:
+            return self.call(self._all_guards[index])
+        cache = self._guard_cache_stack[-1]
+        try:
+            return cache[index]
+        except KeyError:
+            rv = self.call(self._all_guards[index])
+            if index in self._guard_deps:
+                cache[index] = rv
+            return rv
+
     def adapter_init():
         return True
 
     def init(self):
         # initialize adapter
         fmbt._g_actionName = "AAL: adapter_init"
+        self._save_variables(None)
         rv = self.call(self.adapter_init)
+        self._variables_changed(None)
+        self._clear_simulation_cache()
+        if self._tag_cache is not None:
+            self._tag_cache.clear()
         return rv
 
     def adapter_exit(verdict, reason):
@@ -135,7 +569,13 @@ class AALModel:
         if not self._adapter_exit_executed:
             self._adapter_exit_executed = True
             fmbt._g_actionName = "AAL: adapter_exit"
-            self.adapter_exit.im_func(verdict, reason)
+            self._save_variables(None)
+            try:
+                self.adapter_exit.im_func(verdict, reason)
+            finally:
+                self._variables_changed(None)
+                if self._profile_filename:
+                    self.write_profile(self._profile_filename)
 
     def adapter_execute(self, i, adapter_call_arguments = ()):
         if not 0 < i <= len(self._all_names):
@@ -144,7 +584,11 @@ class AALModel:
             try:
                 fmbt._g_actionName = self._all_names[i-1]
                 fmbt._g_testStep += 1
-                rv = self.call(self._all_adapters[i-1], adapter_call_arguments)
+                self._save_variables(None)
+                try:
+                    rv = self.call(self._all_adapters[i-1], adapter_call_arguments)
+                finally:
+                    self._variables_changed(None)
                 fmbt._g_testStep -= 1
                 if rv == None: return i
                 else: return rv
@@ -162,6 +606,7 @@ class AALModel:
         if not 0 < i <= len(self._all_tagnames):
             raise IndexError('Cannot execute tag %s adapter code' % (i,))
         fmbt._g_actionName = "tag: " + self._all_tagnames[i-1]
+        self._save_variables(None)
         try:
             rv = self.call(self._all_tagadapters[i-1])
         except Exception, exc:
@@ -169,6 +614,8 @@ class AALModel:
                 return self.call_tagexception_handler('adapter_exception_handler', self._all_tagnames[i-1], exc)
             else:
                 raise
+        finally:
+            self._variables_changed(None)
         return rv
 
     def model_execute(self, i):
@@ -178,11 +625,37 @@ class AALModel:
             # calling model_execute(0). In AAL/Python it is never ok.
             return 0
         fmbt._g_actionName = self._all_names[i-1]
-        if i in self._enabled_actions_stack[-1] or self.call(self._all_guards[i-1]):
-            self.call(self._all_bodies[i-1])
-            if self._has_serial:
-                for postfunc in getattr(self, self._all_bodies[i-1].__name__ + "_postcall", []):
-                    getattr(self, postfunc)(fmbt._g_actionName)
+        if i in self._enabled_actions_stack[-1] or self._guard(i-1):
+            writes = self._body_writes.get(i-1, None)
+            if self._sim_cache is not None and self._stack and writes != None:
+                key = (self.state_fingerprint(), i)
+                result = self._sim_cache_get(key)
+            else:
+                key, result = None, None
+            self._save_variables(writes, self._has_serial)
+            if result != None:
+                values = cPickle.loads(result)
+                for varname, value in zip(writes, values):
+                    self._variables[varname] = value
+                if self._has_serial:
+                    self._set_serial_state(values[-1])
+                self._variables_changed(writes)
+            else:
+                try:
+                    self.call(self._all_bodies[i-1])
+                finally:
+                    self._variables_changed(writes)
+                if self._has_serial:
+                    for postfunc in getattr(self, self._all_bodies[i-1].__name__ + "_postcall", []):
+                        getattr(self, postfunc)(fmbt._g_actionName)
+                if key != None:
+                    values = [self._variables[varname] for varname in writes]
+                    if self._has_serial:
+                        values.append(self._serial_state())
+                    try:
+                        self._sim_cache_put(key, cPickle.dumps(values, 2))
+                    except Exception:
+                        pass
             if len(self._stack) == 0:
                 fmbt._g_testStep += 1
             if len(self._stack_executed_actions) > 0:
@@ -194,19 +667,28 @@ class AALModel:
             return 0
 
     def getActions(self):
+        # Simulation cache key of enabled actions is (state, 0)
+        if self._sim_cache is not None and self._stack and self._sim_cache_guards:
+            key = (self.state_fingerprint(), 0)
+            enabled_actions = self._sim_cache_get(key)
+            if enabled_actions != None:
+                self._enabled_actions_stack[-1] = set(enabled_actions)
+                return list(enabled_actions)
+        else:
+            key = None
         enabled_actions = []
-        for index, guard in enumerate(self._all_guards):
-            fmbt._g_actionName = self._all_names[index]
-            if self.call(guard): enabled_actions.append(index + 1)
+        for index in xrange(len(self._all_guards)):
+            if self._guard(index): enabled_actions.append(index + 1)
         self._enabled_actions_stack[-1] = set(enabled_actions)
+        if key != None:
+            self._sim_cache_put(key, tuple(enabled_actions))
         return enabled_actions
 
     def getIActions(self):
         enabled_iactions = []
         try:
-            for index, guard in enumerate(self._all_guards):
-                fmbt._g_actionName = self._all_names[index]
-                if self._all_types[index] == "input" and self.call(guard):
+            for index in self._action_table.input_indices:
+                if self._guard(index):
                     enabled_iactions.append(index + 1)
         except Exception, e:
             raise Exception('Error at guard() of "%s": %s: %s' % (
@@ -215,12 +697,84 @@ class AALModel:
         return enabled_iactions
 
     def getprops(self):
+        cache = self._tag_cache
+        if cache is not None and self._sim_cache_tags:
+            if self._tag_cache_trial:
+                start_time = time.time()
+            key = self.state_fingerprint()
+            try:
+                enabled_tags = cache.pop(key)
+            except KeyError:
+                pass
+            else:
+                cache[key] = enabled_tags
+                if self._tag_cache_trial:
+                    self._tag_cache_measured(time.time() - start_time, None)
+                return list(enabled_tags)
+            if self._tag_cache_trial:
+                fingerprint_time = time.time()
+        else:
+            key = None
         enabled_tags = []
         for index, guard in enumerate(self._all_tagguards):
             fmbt._g_actionName = "tag: " + self._all_tagnames[index]
             if self.call(guard): enabled_tags.append(index + 1)
+        if key != None:
+            cache[key] = tuple(enabled_tags)
+            if len(cache) > self._tag_cache_size:
+                cache.popitem(last=False)
+            if self._tag_cache_trial:
+                end_time = time.time()
+                self._tag_cache_measured(fingerprint_time - start_time,
+                                         end_time - fingerprint_time)
         return enabled_tags
 
+    def lookahead(self, depth, uncovered_actions=(), uncovered_tags=()):
+        """
+        Simulate all paths of at most depth actions from the current
+        state. Returns list of (action, score) pairs, one for each
+        enabled action. The score of an action is the largest number
+        of uncovered actions and tags that are executed or reached on
+        a path that starts with the action.
+        """
+        uncovered_actions = frozenset(uncovered_actions)
+        uncovered_tags = frozenset(uncovered_tags)
+        max_score = len(uncovered_actions) + len(uncovered_tags)
+
+        def execute(action, covered):
+            self.model_execute(action)
+            if action in uncovered_actions and not action in covered:
+                covered = covered | frozenset([action])
+            if uncovered_tags:
+                reached = [-tag for tag in self.getprops()
+                           if tag in uncovered_tags and not -tag in covered]
+                if reached:
+                    covered = covered | frozenset(reached)
+            return covered
+
+        def search(depth_left, covered):
+            best = len(covered)
+            if depth_left == 0 or best == max_score:
+                return best
+            for action in self.getActions():
+                self.push()
+                try:
+                    best = max(best, search(depth_left - 1, execute(action, covered)))
+                finally:
+                    self.pop()
+                if best == max_score:
+                    break
+            return best
+
+        scores = []
+        for action in self.getActions():
+            self.push()
+            try:
+                scores.append((action, search(depth - 1, execute(action, frozenset()))))
+            finally:
+                self.pop()
+        return scores
+
     def getActionNames(self):
         return self._all_names
 
@@ -229,25 +783,55 @@ class AALModel:
 
     def push(self):
         # initial state must reset all variables.
-        # automatic push saves only their states
-        stack_element = {}
-        for varname in self._push_variables:
-            stack_element[varname] = copy.deepcopy(self._variables[varname])
-        if self._has_serial:
-            stack_element["!serial_abn"] = copy.deepcopy(self._get_all("guard_next_block", "serial"))
-        self._stack.append(stack_element)
+        # automatic push saves only their states. Values are saved
+        # lazily by _save_variables() when they are about to change,
+        # so push and pop take time proportional to changes only.
+        self._stack.append({})
         self._stack_executed_actions.append([])
         self._enabled_actions_stack.append(set(self._enabled_actions_stack[-1]))
+        self._guard_cache_stack.append(dict(self._guard_cache_stack[-1]))
 
     def pop(self):
         stack_element = self._stack.pop()
         self._stack_executed_actions.pop()
+        saved_digests = stack_element.get("!digests", {})
         for varname in stack_element:
             if varname.startswith("!"): continue
             self._variables[varname] = stack_element[varname]
-        if self._has_serial:
-            self._set_all_class("guard_next_block", "serial", stack_element["!serial_abn"])
+            if varname in saved_digests:
+                self._var_digests[varname] = saved_digests[varname]
+            else:
+                self._var_digests.pop(varname, None)
+        if "!serial_abn" in stack_element:
+            self._set_serial_state(stack_element["!serial_abn"])
         self._enabled_actions_stack.pop()
+        self._guard_cache_stack.pop()
+
+    def snapshot(self):
+        """
+        Return the current state of the model as a string that can be
+        given to restore(), or None if the state cannot be serialised.
+        """
+        values = [self._variables[varname] for varname in self._push_variables]
+        if self._has_serial:
+            values.append(self._serial_state())
+        try:
+            return cPickle.dumps(values, 2)
+        except Exception:
+            return None
+
+    def restore(self, snapshot):
+        """
+        Set the model to the state returned earlier by snapshot().
+        """
+        self._save_variables(None)
+        values = cPickle.loads(snapshot)
+        for varname, value in zip(self._push_variables, values):
+            self._variables[varname] = value
+        if self._has_serial:
+            self._set_serial_state(values[-1])
+        self._variables_changed(None)
+        self._enabled_actions_stack[-1] = set()
 
     def state(self, discard_variables = set([]), include_variables=None):
         """
@@ -261,58 +845,135 @@ class AALModel:
                 continue
             rv_list.append("%s = %s" % (varname, repr(self._variables[varname])))
         if self._has_serial:
-            rv_list.append("!serial = %s" % (self._get_all("guard_next_block", "serial"),))
+            rv_list.append("!serial = %s" % (self._serial_state(),))
         return '\n'.join(rv_list)
 
+    def state_fingerprint(self, discard_variables = set([]), include_variables=None):
+        """
+        Return 128-bit digest of the current state of the model.
+        Digests of states are equal if and only if (up to hash
+        collisions) the strings returned by state() are equal.
+        Digests of variables are cached until they change.
+        """
+        fingerprint = hashlib.md5()
+        var_digests = self._var_digests
+        for varname in self._push_variables:
+            if ((include_variables and not varname in include_variables) or
+                (varname in discard_variables)):
+                continue
+            try:
+                fingerprint.update(var_digests[varname])
+            except KeyError:
+                digest = hashlib.md5("%s = %s" % (
+                    varname, repr(self._variables[varname]))).digest()
+                var_digests[varname] = digest
+                fingerprint.update(digest)
+        if self._has_serial:
+            fingerprint.update("!serial = %s" % (self._serial_state(),))
+        return fingerprint.digest()
+
     def observe(self, block):
-        poll_more = True
-        start_time = 0
+        """
+        Poll adapters of output actions. If block is True and nothing
+        is observed, wait for outputs at most self.timeout seconds.
 
+        Model global dictionary output_poll can map output action
+        names to poll intervals in seconds, or to objects with
+        fileno(), like sockets. Adapters of the latter are polled
+        when the file descriptor is readable. The default interval
+        is _OBSERVE_INTERVAL.
+        """
         # Executing adapter blocks of output actions is allowed to
         # change the state of the model. Allow execution of outputs
         # whose guards are true both before executing adapter blocks*
         # or after it. For that purpose, add currently enabled output
         # actions to enabled_actions_stack.
         enabled_oactions = []
-        for index, guard in enumerate(self._all_guards):
-            fmbt._g_actionName = self._all_names[index]
-            if (self._all_types[index] == "output" and
-                not (index + 1) in self._enabled_actions_stack[-1] and
-                self.call(guard)):
+        for index in self._action_table.output_indices:
+            if (not (index + 1) in self._enabled_actions_stack[-1] and
+                self._guard(index)):
                 enabled_oactions.append(index + 1)
         self._enabled_actions_stack[-1].update(enabled_oactions)
+        self._save_variables(None)
 
-        while poll_more:
-            for index, adapter in enumerate(self._all_adapters):
-                if self._all_types[index] != "output": continue
-                fmbt._g_actionName = self._all_names[index]
-                try:
-                    output_action = self.call(adapter)
-                except Exception, exc:
-                    if 'adapter_exception_handler' in self._variables:
-                        output_action = self.call_exception_handler(
-                            'adapter_exception_handler',
-                            self._all_names[index], exc,
-                            pass_through_rv = [False])
-                    else:
-                        raise
-                observed_action = None
-                if type(output_action) == str:
-                    observed_action = self._all_names.index(output_action) + 1
-                elif type(output_action) == type(True) and output_action == True:
-                    observed_action = index + 1
-                elif type(output_action) == int and output_action > 0:
-                    observed_action = output_action
+        outputs = self._action_table.output_indices
+        for index in outputs:
+            observed_action = self._poll_output(index)
+            if observed_action:
+                return [observed_action]
+        if not block:
+            return [SILENCE]
 
+        # Wait for outputs until timeout. Outputs with a file
+        # descriptor are polled when it becomes readable, others at
+        # their poll interval. Intervals of outputs that keep
+        # returning nothing are doubled, up to _OBSERVE_MAX_BACKOFF
+        # times the original interval.
+        output_poll = self._variables.get('output_poll', {})
+        now = time.time()
+        deadline = now + self.timeout
+        intervals, delays, next_poll, fds = {}, {}, {}, {}
+        for index in outputs:
+            source = output_poll.get(self._all_names[index], _OBSERVE_INTERVAL)
+            if hasattr(source, "fileno"):
+                fds[index] = source.fileno()
+                intervals[index] = _OBSERVE_INTERVAL
+                next_poll[index] = now # watch fd from now on
+            else:
+                intervals[index] = float(source)
+                next_poll[index] = now + intervals[index]
+            delays[index] = intervals[index]
+        while True:
+            watched = set([index for index in fds if next_poll[index] <= now])
+            wake_up = min([next_poll[index] for index in outputs
+                           if not index in watched] + [deadline])
+            if watched:
+                ready, _, _ = select.select([fds[index] for index in watched],
+                                            [], [], max(0, wake_up - now))
+            else:
+                ready = []
+                if wake_up > now: time.sleep(wake_up - now)
+            now = time.time()
+            due = [index for index in outputs
+                   if (fds[index] in ready if index in fds else next_poll[index] <= now)]
+            for index in due:
+                observed_action = self._poll_output(index)
                 if observed_action:
-                    self._log('observe: action "%s" adapter() returned %s. Reporting "%s"' % (
-                            self._all_names[index], output_action,
-                            self._all_names[observed_action-1]))
                     return [observed_action]
-            if block:
-                if not start_time: start_time = time.time()
-                elif time.time() - start_time > self.timeout:
-                    return [SILENCE]
+                next_poll[index] = now + delays[index]
+                delays[index] = min(delays[index] * 2,
+                                    intervals[index] * _OBSERVE_MAX_BACKOFF)
+            if now >= deadline:
+                return [SILENCE]
+
+    def _poll_output(self, index):
+        """
+        Execute the adapter of output action index. Returns the number
+        of the observed action, or None if nothing was observed.
+        """
+        fmbt._g_actionName = self._all_names[index]
+        try:
+            output_action = self.call(self._all_adapters[index])
+        except Exception, exc:
+            if 'adapter_exception_handler' in self._variables:
+                output_action = self.call_exception_handler(
+                    'adapter_exception_handler',
+                    self._all_names[index], exc,
+                    pass_through_rv = [False])
             else:
-                poll_more = False
-        return [SILENCE]
+                raise
+        finally:
+            self._variables_changed(None)
+        observed_action = None
+        if type(output_action) == str:
+            observed_action = self._all_names.index(output_action) + 1
+        elif type(output_action) == type(True) and output_action == True:
+            observed_action = index + 1
+        elif type(output_action) == int and output_action > 0:
+            observed_action = output_action
+
+        if observed_action:
+            self._log('observe: action "%s" adapter() returned %s. Reporting "%s"' % (
+                    self._all_names[index], output_action,
+                    self._all_names[observed_action-1]))
+        return observed_action
@@ -0,0 +1,300 @@
+# fMBT, free Model Based Testing tool
+# Copyright (c) 2013, Intel Corporation.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU Lesser General Public License,
+# version 2.1, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for
+# more details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin St - Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+fmbtcompress reads and writes gzip, bzip2 and xz compressed files
+
+Compression of input is detected from the first bytes of the file,
+and the file is decompressed while it is read. Compression of output
+is chosen by the suffix of the file name: .gz, .bz2 or .xz. xz
+requires the lzma module (Python 3 or backports.lzma).
+
+Example:
+
+import fmbtcompress
+
+for line in fmbtcompress.open_input("test.log.gz"):
+    ...
+
+out = fmbtcompress.open_output("model.lsts.gz")
+out.write(...)
+out.close()
+"""
+
+import bz2
+import itertools
+import sys
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+_CHUNK_SIZE = 1 << 16
+
+_MAGIC = [("gzip", "\x1f\x8b"),
+          ("bzip2", "BZh"),
+          ("xz", "\xfd7zXZ\x00")]
+
+_SUFFIX = {".gz": "gzip", ".bz2": "bzip2", ".xz": "xz"}
+
+HEAD_SIZE = max([len(magic) for _, magic in _MAGIC])
+
+def _lzma():
+    if lzma == None:
+        raise IOError("xz compression requires lzma module")
+    return lzma
+
+def _new_decompressor(compression):
+    if compression == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == "bzip2":
+        return bz2.BZ2Decompressor()
+    else:
+        return _lzma().LZMADecompressor()
+
+def _new_compressor(compression):
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif compression == "bzip2":
+        return bz2.BZ2Compressor()
+    else:
+        return _lzma().LZMACompressor()
+
+def compression(head):
+    """
+    Returns "gzip", "bzip2" or "xz" if head, the first bytes of a
+    file, starts with their magic bytes. Otherwise returns None.
+    """
+    for name, magic in _MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+def strip_suffix(filename):
+    """
+    Returns filename without .gz, .bz2 or .xz suffix.
+    """
+    for suffix in _SUFFIX:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+class _DecompressedFile(object):
+    """
+    Read-only file object that decompresses fileobj while reading.
+    """
+    def __init__(self, fileobj, compression, head=""):
+        self._file = fileobj
+        self._compression = compression
+        self._read_raw = getattr(fileobj, "read", None) or (
+            lambda size: fileobj.readline())
+        self._reset(head)
+
+    def _reset(self, head):
+        self._head = head
+        self._decompressor = _new_decompressor(self._compression)
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _more(self):
+        """
+        Decompresses the next chunk of fileobj to the buffer.
+        """
+        data = self._head or self._read_raw(_CHUNK_SIZE)
+        self._head = ""
+        if not data:
+            self._eof = True
+            return
+        out = [self._buf[self._pos:], self._decompressor.decompress(data)]
+        # concatenated streams, like "cat a.gz b.gz"
+        unused = self._decompressor.unused_data
+        while unused:
+            self._decompressor = _new_decompressor(self._compression)
+            out.append(self._decompressor.decompress(unused))
+            unused = self._decompressor.unused_data
+        self._buf = "".join(out)
+        self._pos = 0
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buf) - self._pos < size):
+            self._more()
+        if size < 0:
+            end = len(self._buf)
+        else:
+            end = self._pos + size
+        data = self._buf[self._pos:end]
+        self._pos += len(data)
+        return data
+
+    def readline(self, size=-1):
+        end = self._buf.find("\n", self._pos)
+        while end == -1 and not self._eof:
+            searched = len(self._buf) - self._pos
+            self._more()
+            end = self._buf.find("\n", searched)
+        if end == -1:
+            end = len(self._buf)
+        else:
+            end += 1
+        if size >= 0:
+            end = min(end, self._pos + size)
+        line = self._buf[self._pos:end]
+        self._pos = end
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, "")
+
+    def seek(self, offset, whence=0):
+        if offset != 0 or whence != 0:
+            raise IOError("compressed file can be seeked only to the beginning")
+        self._file.seek(0)
+        self._reset("")
+
+    def close(self):
+        self._file.close()
+
+class _PrefixedFile(object):
+    """
+    Read-only file object that returns head before the rest of
+    fileobj. Used for uncompressed files that cannot seek back.
+    """
+    def __init__(self, fileobj, head):
+        self._file = fileobj
+        self._head = head
+
+    def read(self, size=-1):
+        head, self._head = self._head, ""
+        if size < 0:
+            return head + self._file.read()
+        elif size <= len(head):
+            self._head = head[size:]
+            return head[:size]
+        return head + self._file.read(size - len(head))
+
+    def readline(self, size=-1):
+        head, self._head = self._head, ""
+        newline = head.find("\n")
+        if newline >= 0:
+            self._head = head[newline+1:]
+            return head[:newline+1]
+        return head + self._file.readline()
+
+    def __iter__(self):
+        head, self._head = self._head, ""
+        lines = iter(self._file)
+        if not head:
+            return lines
+        parts = head.split("\n")
+        first_lines = [part + "\n" for part in parts[:-1]]
+        if parts[-1]:
+            first_lines.append(parts[-1] + next(lines, ""))
+        return itertools.chain(first_lines, lines)
+
+    def close(self):
+        self._file.close()
+
+class _CompressedFile(object):
+    """
+    Write-only file object that compresses data written to fileobj.
+    """
+    def __init__(self, fileobj, compression):
+        self._file = fileobj
+        self._compressor = _new_compressor(compression)
+        self.name = getattr(fileobj, "name", None)
+
+    def write(self, data):
+        self._file.write(self._compressor.compress(data))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._compressor:
+            self._file.write(self._compressor.flush())
+            self._compressor = None
+        self._file.close()
+
+def decompressed(fileobj, head=None):
+    """
+    Returns file object that reads fileobj decompressed if it is
+    compressed, otherwise fileobj itself or an equivalent object.
+
+    Parameters:
+
+      fileobj (file object):
+              file to be read, must have read or readline method.
+
+      head (string, optional):
+              first bytes already read from fileobj. If not given,
+              HEAD_SIZE bytes are read here.
+    """
+    if head == None:
+        try:
+            pos = fileobj.tell()
+        except (AttributeError, IOError):
+            pos = None
+        head = fileobj.read(HEAD_SIZE)
+        c = compression(head)
+        if pos != None:
+            try:
+                fileobj.seek(pos)
+                head = ""
+            except IOError:
+                pass
+        if head and not c:
+            return _PrefixedFile(fileobj, head)
+    else:
+        c = compression(head)
+    if c:
+        if c == "xz":
+            _lzma()
+        return _DecompressedFile(fileobj, c, head)
+    return fileobj
+
+def compressed(fileobj, filename):
+    """
+    Returns file object that writes to fileobj compressed if filename
+    ends with .gz, .bz2 or .xz, otherwise fileobj itself.
+    """
+    for suffix, c in _SUFFIX.iteritems():
+        if filename.endswith(suffix):
+            return _CompressedFile(fileobj, c)
+    return fileobj
+
+def open_input(filename):
+    """
+    Opens file for reading, "-" is standard input. Compressed files
+    are decompressed.
+    """
+    if filename == "-":
+        return decompressed(sys.stdin)
+    return decompressed(file(filename, "rb"))
+
+def open_output(filename):
+    """
+    Opens file for writing, "-" is standard output. Output is
+    compressed if filename ends with .gz, .bz2 or .xz.
+    """
+    if filename == "-":
+        return sys.stdout
+    return compressed(file(filename, "wb"), filename)
@@ -84,8 +84,39 @@ for source_state, transition_list in enumerate(r.get_transitions()):
 
 ***
 
+Example IV: convert lsts from stdin to binary lstsb format. reader
+detects the format of the file it reads.
+
+import sys
+import lsts
+
+lsts.writer(lsts_object=lsts.reader(sys.stdin)).write_lstsb(sys.stdout)
+
+***
+
+Example V: print action names of a large lsts. Only the header and
+action names are read from the file. Other sections would be read if
+they were accessed.
+
+import lsts
+
+r = lsts.reader(file("large.lsts"),sections=("header","action_names"))
+
+for action_name in r.get_actionnames()[1:]:
+    print action_name
+
+***
+
 Helper classes and functions
 
+class csr_transitions stores transitions in three integer arrays
+(compressed sparse rows). get_transitions returns an instance of it.
+It can be used like a read-only list of tuples of transitions, but
+out_transitions(state) and transition_count are faster:
+
+for dest_state, action_number in r.out_transitions(source_state):
+    ...
+
 class fakefile can be used to create a file-like object from a
 string. The object can be used for reading and writing LSTSs. For
 example, if string s contains an LSTS
@@ -111,8 +142,12 @@ name_of_prop=stateproplist[num_of_a_stateprop]
 
 """
 
-version="0.522 svn"
+version="0.526 svn"
 
+# 0.525 -> 0.526 selected sections read, others read on first access
+# 0.524 -> 0.525 state prop ranges written, stream_writer
+# 0.523 -> 0.524 binary lstsb format
+# 0.522 -> 0.523 transitions stored in csr_transitions
 # 0.490 -> 0.522 support for dos lines (carriage returns are removed)
 # 0.110 -> 0.490 support for multirow action names
 # 0.55 -> 0.110 lsts file objects can be read and written already in
@@ -128,7 +163,16 @@ version="0.522 svn"
 
 # 0.50 -> 0.52 added support for state prop ranges "x..y"
 
-from sys import stderr
+import re
+import struct
+from sys import stderr,byteorder
+from array import array
+from itertools import izip
+
+try:
+    import fmbtcompress
+except ImportError:
+    fmbtcompress=None
 
 class fakefile:
     """
@@ -139,10 +183,14 @@ class fakefile:
     """
     def __init__(self,lstscontents):
         self.s=lstscontents
+        self._pos=0 # readline position
     def readline(self):
-        l=self.s[:self.s.find("\n")+1]
-        self.s=self.s[self.s.find("\n")+1:]
-        return l
+        start=self._pos
+        end=self.s.find("\n",start)+1
+        if end==0:
+            end=len(self.s)
+        self._pos=end
+        return self.s[start:end]
     def write(self,s):
         self.s+=s
 
@@ -168,6 +216,83 @@ def props_by_states(lsts_object):
     return statetbl
 
 
+class csr_transitions(object):
+    """
+    Transitions stored as compressed sparse rows. Transitions leaving
+    state s are (dests[i], actions[i]) for i in xrange(offsets[s],
+    offsets[s+1]). offsets, dests and actions are array('i')
+    attributes.
+
+    For backward compatibility the object can be indexed and iterated
+    like a list of tuples of (dest_state, action_index) pairs. The
+    tuples are created on demand. Transitions cannot be modified in
+    place, use lsts.set_transitions instead.
+    """
+    def __init__(self,transitions=()):
+        """
+        Parameters:
+
+        - optional transitions is a list of lists of pairs as in
+          lsts.set_transitions.
+        """
+        self.offsets=array('i',[0])
+        self.dests=array('i')
+        self.actions=array('i')
+        for s in transitions:
+            for dest_state,action_index in s:
+                self.dests.append(dest_state)
+                self.actions.append(action_index)
+            self.offsets.append(len(self.dests))
+
+    def out_transitions(self,state):
+        """
+        Returns an iterator over (dest_state, action_index) pairs
+        leaving the state.
+        """
+        if state<0:
+            state+=len(self.offsets)-1
+        first,last=self.offsets[state],self.offsets[state+1]
+        return izip(self.dests[first:last],self.actions[first:last])
+
+    @property
+    def transition_count(self):
+        return len(self.dests)
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+    def __getitem__(self,state):
+        if isinstance(state,slice):
+            return [self[s] for s in xrange(*state.indices(len(self)))]
+        if state<0:
+            state+=len(self.offsets)-1
+        if not 0<=state<len(self.offsets)-1:
+            raise IndexError("state index out of range")
+        first,last=self.offsets[state],self.offsets[state+1]
+        return tuple(izip(self.dests[first:last],self.actions[first:last]))
+
+    def __setitem__(self,state,transitions):
+        raise TypeError("csr_transitions cannot be modified, use set_transitions")
+
+    def __delitem__(self,state):
+        raise TypeError("csr_transitions cannot be modified, use set_transitions")
+
+    def __iter__(self):
+        dests,actions,offsets=self.dests,self.actions,self.offsets
+        for state in xrange(len(offsets)-1):
+            first,last=offsets[state],offsets[state+1]
+            yield tuple(izip(dests[first:last],actions[first:last]))
+
+    def __eq__(self,other):
+        if isinstance(other,csr_transitions):
+            return (self.offsets==other.offsets and self.dests==other.dests
+                    and self.actions==other.actions)
+        return [list(s) for s in self]==[list(s) for s in other]
+
+    def __ne__(self,other):
+        return not self==other
+
+
 class _header:
     pass
 
@@ -182,7 +307,7 @@ class lsts:
         self._header.initial_states=0
 
         self._actionnames=[]
-        self._transitions=[]
+        self._transitions=csr_transitions()
         self._stateprops={} # state prop name -> list of states
         self._layout=[]
 
@@ -218,16 +343,21 @@ class lsts:
         actionnames lists. That is, they may have values from 0 to
         len(list)-1.
 
+        - transitions can also be a csr_transitions object.
+
         Notes:
 
+        Transitions are stored as csr_transitions, get_transitions
+        does not return the list given here.
+
         This method modifies State_cnt and Transition_cnt fields in
         the header.
         """
+        if not isinstance(transitions,csr_transitions):
+            transitions=csr_transitions(transitions)
         self._transitions=transitions
         self._header.state_cnt=len(transitions)
-        self._header.transition_cnt=0
-        for s in transitions:
-            self._header.transition_cnt+=len(s)
+        self._header.transition_cnt=transitions.transition_count
 
     def set_stateprops(self,stateprops):
         """
@@ -256,8 +386,20 @@ class lsts:
         return self._actionnames
 
     def get_transitions(self):
+        """
+        Returns transitions as a csr_transitions object, which can be
+        used like a read-only list of tuples of (dest_state,
+        action_index) pairs.
+        """
         return self._transitions
 
+    def out_transitions(self,state):
+        """
+        Returns an iterator over (dest_state, action_index) pairs
+        leaving the state.
+        """
+        return self._transitions.out_transitions(state)
+
     def get_stateprops(self):
         return self._stateprops
 
@@ -326,75 +468,672 @@ class writer(lsts):
             self._written_in_constructor=None
             return
 
-        file.write("Begin Lsts\n\n")
+        self._write_head(file,stateprop_order)
 
-        file.write("Begin History\n")
-        for num,s in enumerate(self._history):
-            file.write("\t"+str(num+1)+"\n")
-            file.write("\t\""+s+"\"\n")
+        file.write("Begin Transitions\n")
+        transitions=self._transitions
+        offsets,dests,actions=transitions.offsets,transitions.dests,transitions.actions
+        # action numbers are converted to strings only once
+        action_cnt=len(self._actionnames)
+        if len(actions):
+            action_cnt=max(action_cnt,max(actions)+1)
+        action_strs=[","+str(a) for a in xrange(action_cnt)]
+        for first_state in xrange(0,len(offsets)-1,_WRITE_STATES):
+            rows=[]
+            for si in xrange(first_state,min(first_state+_WRITE_STATES,len(offsets)-1)):
+                first,last=offsets[si],offsets[si+1]
+                rows.append(" "+str(si+1)+":"+
+                            "".join([" "+str(dest_state+1)+action_strs[action_index]
+                                     for dest_state,action_index in
+                                     izip(dests[first:last],actions[first:last])])+
+                            ";\n")
+            file.write("".join(rows))
+        file.write("End Transitions\n\n")
 
-        file.write("End History\n\n")
+        self._write_tail(file)
 
-        file.write("Begin Header\n")
-        file.write(" State_cnt = " + str(self._header.state_cnt) + "\n")
-        file.write(" Action_cnt = " + str(self._header.action_cnt) + "\n")
-        file.write(" Transition_cnt = " + str(self._header.transition_cnt) + "\n")
-        if self._stateprops:
-            file.write(" State_prop_cnt = " + str(self._header.state_prop_cnt) + "\n")
-        file.write(" Initial_states = " + str(self._header.initial_states+1) + ";\n")
-        file.write("End Header\n\n")
+    def write_lstsb(self,file=None,stateprop_order=None):
+        """
+        Parameters:
 
-        file.write("Begin Action_names\n")
-        for ai,a in enumerate(self._actionnames[1:]):
-            file.write(" "+str(ai+1)+' = "'+a.replace('"','\\"')+'"\n')
-        file.write("End Action_names\n\n")
+        - optional parameter file is the same as in __init__.
 
+        Notes:
+
+        Writes all lsts information to the given file object in the
+        binary lstsb format. The reader class detects the format
+        automatically.
+        """
+        if not file:
+            file=self.__file
+        if stateprop_order==None:
+            propnames=self._stateprops.keys()
+            propnames.sort()
+        else:
+            propnames=stateprop_order
+        bitset_len=(self._header.state_cnt+7)//8
+        bitsets=[]
+        for key in propnames:
+            bits=bytearray(bitset_len)
+            for state in self._stateprops[key]:
+                bits[state>>3]|=1<<(state&7)
+            bitsets.append(str(bits))
+        layout=array('i')
+        for state,coords in enumerate(self._layout):
+            if coords!=None:
+                layout.extend((state,coords[0],coords[1]))
+        transitions=self._transitions
+        sections=[_lstsb_strings(self._history),
+                  _lstsb_strings(self._actionnames),
+                  _lstsb_ints(transitions.offsets),
+                  _lstsb_ints(transitions.dests),
+                  _lstsb_ints(transitions.actions),
+                  _lstsb_strings(propnames),
+                  "".join(bitsets),
+                  _lstsb_ints(layout)]
+        head=[_LSTSB_MAGIC,
+              struct.pack(_LSTSB_HEADER,_LSTSB_VERSION,
+                          self._header.state_cnt,len(self._actionnames)-1,
+                          transitions.transition_count,len(propnames),
+                          self._header.initial_states)]
+        pos=len(_LSTSB_MAGIC)+_LSTSB_HEADER_SIZE+_LSTSB_SECTION_SIZE*len(sections)
+        section_starts=[]
+        for data in sections:
+            pos=_lstsb_aligned(pos)
+            section_starts.append(pos)
+            head.append(struct.pack(_LSTSB_SECTION,pos,len(data)))
+            pos+=len(data)
+        file.write("".join(head))
+        pos=len(_LSTSB_MAGIC)+_LSTSB_HEADER_SIZE+_LSTSB_SECTION_SIZE*len(sections)
+        for start,data in zip(section_starts,sections):
+            file.write("\0"*(start-pos))
+            file.write(data)
+            pos=start+len(data)
+
+    def _write_head(self,file,stateprop_order):
+        """
+        Writes sections before transitions.
+        """
+        file.write("Begin Lsts\n\n"+
+                   self._history_section()+
+                   self._header_section()+
+                   self._action_names_section()+
+                   self._stateprops_section(stateprop_order))
+
+    def _write_tail(self,file):
+        """
+        Writes sections after transitions.
+        """
+        file.write(self._layout_section()+"End Lsts\n")
+
+    def _history_section(self):
+        return ("Begin History\n"+
+                "".join(["\t"+str(num+1)+"\n\t\""+s+"\"\n"
+                         for num,s in enumerate(self._history)])+
+                "End History\n\n")
+
+    def _header_section(self,width=0):
+        """
+        Returns the header section. If width is given, values are
+        padded to the width and State_prop_cnt is always included, so
+        that the section can be overwritten later with different
+        values.
+        """
+        fields=[("State_cnt",str(self._header.state_cnt)),
+                ("Action_cnt",str(self._header.action_cnt)),
+                ("Transition_cnt",str(self._header.transition_cnt))]
         if self._stateprops:
-            file.write("Begin State_props\n")
-            if stateprop_order == None:
-                propnames=self._stateprops.keys()
-                propnames.sort()
-            else:
-                propnames = stateprop_order
-            for key in propnames:
-                file.write('  "%s" :' % key.replace('"','\\"'))
-                for v in self._stateprops[key]:
-                    file.write(' %s' % (v+1))
-                file.write(';\n')
-            file.write("End State_props\n\n")
+            fields.append(("State_prop_cnt",str(self._header.state_prop_cnt)))
+        fields.append(("Initial_states",str(self._header.initial_states+1)+";"))
+        rows=[" "+name+" = "+value.ljust(width)+"\n" for name,value in fields]
+        if width and not self._stateprops:
+            # a blank row in place of State_prop_cnt
+            rows.insert(3," "*len(" State_prop_cnt = "+"".ljust(width))+"\n")
+        return "Begin Header\n"+"".join(rows)+"End Header\n\n"
+
+    def _action_names_section(self):
+        return ("Begin Action_names\n"+
+                "".join([" "+str(ai+1)+' = "'+a.replace('"','\\"')+'"\n'
+                         for ai,a in enumerate(self._actionnames[1:])])+
+                "End Action_names\n\n")
+
+    def _stateprops_section(self,stateprop_order):
+        """
+        Returns the state propositions section. Consecutive states are
+        written as ranges x..y.
+        """
+        if not self._stateprops:
+            return ""
+        if stateprop_order==None:
+            propnames=self._stateprops.keys()
+            propnames.sort()
+        else:
+            propnames=stateprop_order
+        return ("Begin State_props\n"+
+                "".join(['  "%s" :%s;\n' % (key.replace('"','\\"'),
+                                            _ranges(self._stateprops[key]))
+                         for key in propnames])+
+                "End State_props\n\n")
+
+    def _layout_section(self):
+        if not self._layout:
+            return ""
+        return ("Begin Layout\n"+
+                "".join([' %s %s %s\n' % (num+1,val[0],val[1])
+                         for num,val in enumerate(self._layout)
+                         if val!=None])+
+                "End Layout\n")
+
+
+_WRITE_STATES=4096 # states formatted in a buffer before writing
+
+def _transition_row(state,transitions):
+    """
+    Returns row of Transitions section for (dest_state, action_index)
+    pairs leaving the state.
+    """
+    return (" "+str(state+1)+":"+
+            "".join([" "+str(dest_state+1)+","+str(action_index)
+                     for dest_state,action_index in transitions])+
+            ";\n")
 
+def _ranges(states):
+    """
+    Returns states in State_props syntax: numbers start from 1, runs of
+    three or more consecutive states are written as x..y.
+    """
+    items=[]
+    run_first=run_last=None
+    for state in states:
+        if run_last!=None and state==run_last+1:
+            run_last=state
+            continue
+        if run_last!=None:
+            items.append(_range_item(run_first,run_last))
+        run_first=run_last=state
+    if run_last!=None:
+        items.append(_range_item(run_first,run_last))
+    return "".join(items)
+
+def _range_item(first,last):
+    if last-first>=2:
+        return " %s..%s" % (first+1,last+1)
+    elif last>first:
+        return " %s %s" % (first+1,last+1)
+    return " %s" % (first+1,)
+
+
+class spool_writer(writer):
+    """
+    LSTS writer that takes transitions one state at a time, before
+    state propositions are known. Transitions are spooled to a
+    temporary file, so they need not be kept in memory. The header,
+    action names and state propositions are written in front of them
+    by write().
+
+    Example: write a two-state LSTS
+
+    w = lsts.spool_writer( file("out.lsts","w") )
+    w.append_transitions( [(1,1)] )
+    w.append_transitions( [(0,2)] )
+    w.set_actionnames( ["tau","action1","action2"] )
+    w.set_stateprops( {"first": [0]} )
+    w.write()
+    """
+    def __init__(self,file=None):
+        import tempfile
+        writer.__init__(self,file)
+        self._spool=tempfile.TemporaryFile()
+
+    def append_transitions(self,state_transitions):
+        """
+        Parameters:
+
+        - state_transitions is a list of pairs (dest_state,
+          action_index) that leave the next state. The first call
+          gives transitions of state 0.
+
+        Notes:
+
+        This method modifies State_cnt and Transition_cnt fields in
+        the header.
+        """
+        self._spool.write(_transition_row(self._header.state_cnt,state_transitions))
+        self._header.state_cnt+=1
+        self._header.transition_cnt+=len(state_transitions)
+
+    def set_transitions(self,transitions):
+        raise TypeError("spool_writer takes transitions by append_transitions")
+
+    def write(self,file=None,stateprop_order=None):
+        import shutil
+        if not file:
+            file=self._writer__file
+        self._write_head(file,stateprop_order)
         file.write("Begin Transitions\n")
-        for si,s in enumerate(self._transitions):
-            file.write(" "+str(si+1)+":")
-            for (dest_state,action_index) in s:
-                file.write(" "+str(dest_state+1)+","+str(action_index))
-            file.write(";\n")
+        self._spool.seek(0)
+        shutil.copyfileobj(self._spool,file)
+        self._spool.seek(0,2)
         file.write("End Transitions\n\n")
+        self._write_tail(file)
+
+    def write_lstsb(self,file=None,stateprop_order=None):
+        raise TypeError("spool_writer writes only text LSTS")
+
+
+class stream_writer(writer):
+    """
+    LSTS writer that writes transitions to the file immediately when
+    they are given. The header is written with placeholder values in
+    the constructor and overwritten with the final counts by write(),
+    so the file must be seekable. Action names, state propositions and
+    layout are written after transitions.
+
+    Example: write a two-state LSTS
+
+    w = lsts.stream_writer( file("out.lsts","w") )
+    w.append_transitions( [(1,1)] )
+    w.append_transitions( [(0,2)] )
+    w.set_actionnames( ["tau","action1","action2"] )
+    w.set_stateprops( {"first": [0]} )
+    w.write()
+    """
+    _header_width=20
+
+    def __init__(self,file):
+        writer.__init__(self,file)
+        file.write("Begin Lsts\n\n"+self._history_section())
+        self._header_pos=file.tell()
+        file.write(self._header_section(self._header_width)+"Begin Transitions\n")
+        self._rows=[]
+
+    def append_transitions(self,state_transitions):
+        """
+        Parameters:
+
+        - state_transitions is a list of pairs (dest_state,
+          action_index) that leave the next state. The first call
+          gives transitions of state 0.
+
+        Notes:
+
+        This method modifies State_cnt and Transition_cnt fields in
+        the header.
+        """
+        self._rows.append(_transition_row(self._header.state_cnt,state_transitions))
+        self._header.state_cnt+=1
+        self._header.transition_cnt+=len(state_transitions)
+        if len(self._rows)>=_WRITE_STATES:
+            self._writer__file.write("".join(self._rows))
+            self._rows=[]
+
+    def set_transitions(self,transitions):
+        raise TypeError("stream_writer takes transitions by append_transitions")
+
+    def write(self,file=None,stateprop_order=None):
+        """
+        Parameters:
+
+        - optional parameter file must be the same as in __init__.
+
+        Notes:
+
+        Finishes the LSTS: writes remaining transitions and sections
+        after them, and updates the header.
+        """
+        if file and file!=self._writer__file:
+            raise ValueError("stream_writer writes only to the file given in __init__")
+        file=self._writer__file
+        file.write("".join(self._rows)+"End Transitions\n\n"+
+                   self._action_names_section()+
+                   self._stateprops_section(stateprop_order))
+        self._rows=[]
+        self._write_tail(file)
+        end_pos=file.tell()
+        file.seek(self._header_pos)
+        file.write(self._header_section(self._header_width))
+        file.seek(end_pos)
+
+    def write_lstsb(self,file=None,stateprop_order=None):
+        raise TypeError("stream_writer writes only text LSTS")
+
+
+# Binary LSTS format (lstsb). Integers are little-endian, int32
+# unless noted. The file starts with
+#
+#   _LSTSB_MAGIC
+#   _LSTSB_HEADER: version, state_cnt, action_cnt, transition_cnt,
+#                  state_prop_cnt, initial_state
+#   _LSTSB_SECTION (uint64 offset, uint64 length) for each section
+#                  in _LSTSB_SECTIONS
+#
+# followed by the sections, each aligned to 8 bytes:
+#
+#   history          string table
+#   action_names     string table, "tau" included
+#   offsets, dests,  arrays of csr_transitions
+#   actions
+#   stateprop_names  string table
+#   stateprops       bitset of (state_cnt+7)/8 bytes for each
+#                    state proposition, bit s is set if the
+#                    proposition is true in state s
+#   layout           state, xcoord, ycoord for every state in layout
+#
+# A string table is the number of strings, their lengths and their
+# contents concatenated.
+
+_LSTSB_MAGIC="\x89LSTSB\r\n"
+_LSTSB_VERSION=1
+_LSTSB_HEADER="<IIIIIi"
+_LSTSB_HEADER_SIZE=struct.calcsize(_LSTSB_HEADER)
+_LSTSB_SECTION="<QQ"
+_LSTSB_SECTION_SIZE=struct.calcsize(_LSTSB_SECTION)
+_LSTSB_SECTIONS=("history","action_names","offsets","dests","actions",
+                 "stateprop_names","stateprops","layout")
+_unpack_int=struct.Struct("<i").unpack_from
+_nonzero_bytes=re.compile("[^\0]+")
+_bits_in_byte=[[bit for bit in xrange(8) if byte&(1<<bit)]
+               for byte in xrange(256)]
+
+def _lstsb_aligned(pos):
+    return (pos+7)&~7
+
+def _lstsb_ints(ints):
+    if not isinstance(ints,array):
+        ints=ints[:] # _mapped_ints
+    if byteorder=="big":
+        ints=array('i',ints)
+        ints.byteswap()
+    return ints.tostring()
+
+def _lstsb_strings(strings):
+    return (struct.pack("<i",len(strings))+
+            _lstsb_ints(array('i',[len(s) for s in strings]))+
+            "".join(strings))
+
+def _lstsb_read_ints(data,offset,length):
+    if byteorder=="little":
+        return _mapped_ints(data,offset,length//4)
+    ints=array('i')
+    ints.fromstring(data[offset:offset+length])
+    ints.byteswap()
+    return ints
+
+def _lstsb_read_strings(data,offset,length):
+    count=_unpack_int(data,offset)[0]
+    lengths=_lstsb_read_ints(data,offset+4,count*4)[:]
+    pos=offset+4+count*4
+    strings=[]
+    for l in lengths:
+        strings.append(data[pos:pos+l])
+        pos+=l
+    return strings
+
+def _lstsb_read_bitset(data,offset,length):
+    """
+    Returns sorted list of numbers of bits set in the bitset.
+    """
+    bits=data[offset:offset+length]
+    numbers=[]
+    for run in _nonzero_bytes.finditer(bits):
+        for pos,byte in enumerate(run.group(),run.start()):
+            numbers.extend([pos*8+bit for bit in _bits_in_byte[ord(byte)]])
+    return numbers
+
+class _mapped_ints(object):
+    """
+    Read-only array('i') lookalike on little-endian int32 data in a
+    string or an mmap. Items are read from the data without copying
+    it, slices are returned as arrays.
+    """
+    __slots__=["_data","_offset","_len"]
+    def __init__(self,data,offset,count):
+        self._data=data
+        self._offset=offset
+        self._len=count
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self,i):
+        if type(i) is slice:
+            first,last=i.start,i.stop
+            if (i.step==None and first!=None and last!=None and
+                0<=first<=last<=self._len):
+                ints=array('i')
+                ints.fromstring(self._data[self._offset+4*first:self._offset+4*last])
+                return ints
+            first,last,step=i.indices(self._len)
+            if step!=1:
+                return array('i',[self[j] for j in xrange(first,last,step)])
+            ints=array('i')
+            if last>first:
+                ints.fromstring(self._data[self._offset+4*first:self._offset+4*last])
+            return ints
+        if i<0:
+            i+=self._len
+        if not 0<=i<self._len:
+            raise IndexError("array index out of range")
+        return _unpack_int(self._data,self._offset+4*i)[0]
+
+    def __iter__(self):
+        for first in xrange(0,self._len,1<<16):
+            for i in self[first:first+(1<<16)]:
+                yield i
+
+    def __eq__(self,other):
+        return self[:]==other
+
+    def __ne__(self,other):
+        return not self==other
+
+def _lstsb_data(file,head):
+    """
+    Returns contents of lstsb file whose first bytes, head, have been
+    read already. Regular files are memory mapped.
+    """
+    try:
+        if file.tell()==len(head):
+            import mmap
+            return mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ)
+    except (AttributeError,EnvironmentError,ValueError):
+        pass
+    if hasattr(file,"read"):
+        return head+file.read()
+    return head+"".join(iter(file.readline,""))
+
+
+def _head(file):
+    """
+    Returns the first bytes of file: as many as there are in
+    _LSTSB_MAGIC if file has read method, otherwise the first line.
+    """
+    if hasattr(file,"read"):
+        return file.read(len(_LSTSB_MAGIC))
+    return file.readline()
+
+def _lines(file,head=""):
+    """
+    Return an iterator over lines of file. Files with read method are
+    read in large chunks, other objects line by line with readline.
+    head is data already read from the file.
+    """
+    if isinstance(file,type(stderr)):
+        lines=iter(file)
+    elif hasattr(file,"read"):
+        return _chunked_lines(file,head)
+    else:
+        lines=iter(file.readline,"")
+    if head:
+        return _prefixed_lines(head,lines)
+    return lines
+
+def _prefixed_lines(head,lines):
+    parts=head.split("\n")
+    for part in parts[:-1]:
+        yield part+"\n"
+    if parts[-1]:
+        yield parts[-1]+next(lines,"")
+    for l in lines:
+        yield l
+
+def _chunked_lines(file,rest="",chunk_size=1<<20):
+    while 1:
+        chunk=file.read(chunk_size)
+        if not chunk:
+            break
+        lines=chunk.split("\n")
+        lines[0]=rest+lines[0]
+        rest=lines.pop()
+        for l in lines:
+            yield l+"\n"
+    if rest:
+        yield rest
+
+class _section_lines(object):
+    """
+    Iterator over lines of file that can also skip a section without
+    splitting it to lines. Skipped sections and the rest of the file
+    can be read later through sources returned by skip_section and
+    rest. If file can seek, sources seek to the offset of the section,
+    otherwise skipped sections are kept as text.
+    """
+    def __init__(self,file,head="",chunk_size=1<<20):
+        self._file=file
+        self._read=getattr(file,"read",None)
+        self._buf=head
+        self._pos=0
+        self._chunk_size=chunk_size
+        try:
+            self._offset=file.tell()-len(head) # file offset of _buf[0]
+            file.seek(file.tell())
+        except (AttributeError,EnvironmentError,ValueError):
+            self._offset=None
+
+    def _more(self):
+        """
+        Appends next chunk of file to the buffer. Returns False on EOF.
+        """
+        if self._read:
+            data=self._read(self._chunk_size)
+        else:
+            data=self._file.readline()
+        if not data:
+            return False
+        if self._offset!=None:
+            self._offset+=self._pos
+        self._buf=self._buf[self._pos:]+data
+        self._pos=0
+        return True
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        end=self._buf.find("\n",self._pos)
+        while end==-1:
+            searched=len(self._buf)-self._pos
+            if not self._more():
+                if self._pos==len(self._buf):
+                    raise StopIteration
+                end=len(self._buf)-1
+                break
+            end=self._buf.find("\n",searched)
+        line=self._buf[self._pos:end+1]
+        self._pos=end+1
+        return line
+
+    def _source(self,text_parts):
+        if self._offset!=None:
+            file,offset=self._file,self._offset+self._pos
+            def source():
+                file.seek(offset)
+                return _lines(file)
+        else:
+            text="".join(text_parts)
+            def source():
+                return iter(text.splitlines(True))
+        return source
 
-        if self._layout:
-            file.write("Begin Layout\n")
-            for statenum, xcoor, ycoord in [(num, val[0], val[1])
-                                            for num, val in enumerate(self._layout)
-                                            if val!=None]:
-                file.write(' %s %s %s\n' % (statenum+1, xcoor, ycoord))
-            file.write("End Layout\n")
+    def skip_section(self,name):
+        """
+        Skips rows until "end name" row, which is not skipped. Returns
+        a function that returns an iterator over the skipped rows.
+        """
+        end_row=re.compile(r"^[ \t]*end[ \t]+%s[ \t]*\r?$" % (name,),
+                           re.IGNORECASE | re.MULTILINE)
+        if self._offset!=None:
+            source=self._source(None)
+            text_parts=None
+        else:
+            text_parts=[]
+        while 1:
+            m=end_row.search(self._buf,self._pos)
+            if m and m.end()==len(self._buf) and self._more():
+                continue # the row may continue in the next chunk
+            if m:
+                end=m.start()
+            else:
+                end=self._buf.rfind("\n",self._pos)+1
+            if text_parts!=None:
+                text_parts.append(self._buf[self._pos:end])
+            self._pos=max(end,self._pos)
+            if m:
+                break
+            if not self._more():
+                if text_parts!=None:
+                    text_parts.append(self._buf[self._pos:])
+                self._pos=len(self._buf)
+                break
+        if text_parts!=None:
+            source=self._source(text_parts)
+        return source
+
+    def rest(self):
+        """
+        Returns a function that returns an iterator over the rest of
+        the rows.
+        """
+        if self._offset!=None:
+            return self._source([])
+        return lambda: self
 
-        file.write("End Lsts\n")
 
+_SECTION_NAMES=("history","header","action_names","transitions",
+                "state_props","layout")
 
 class reader(lsts):
-    def __init__(self,file=None):
+    def __init__(self,file=None,sections=None):
         """
         Parameters:
 
-        - Optional parameter file should provide method 'read'. Valid
-        objects are, for example, files opened for reading and
-        sys.stdin. If file_object is given, the file is immediately
-        read, so there is no need to call read method afterwards."""
+        - Optional parameter file should provide method 'read' or
+        'readline'. Valid objects are, for example, files opened for
+        reading and sys.stdin. If file_object is given, the file is
+        immediately read, so there is no need to call read method
+        afterwards.
+
+        - Optional parameter sections is a list of names of sections
+        to be read: "history", "header", "action_names",
+        "transitions", "state_props" and "layout". The header is
+        always read. Other sections are skipped without parsing, and
+        they are read when accessed for the first time, for instance
+        by get_transitions. The file must not be closed before
+        that. By default all sections are read."""
 
         lsts.__init__(self)
         self.__already_read=0
         self.__file=file
+        if sections!=None:
+            for name in sections:
+                if not name in _SECTION_NAMES:
+                    raise ValueError("Unknown LSTS section: '%s'" % (name,))
+            sections=set(sections)
+            sections.add("header")
+        self.__wanted=sections
+        self.__pending={} # section name -> function that reads it
+        self.__rest=None # function that reads the unread end of file
+        self.__loaded=set(_SECTION_NAMES)
         self.__sections=["begin lsts",
                          "begin history","end history",
                          "begin header","end header",
@@ -403,7 +1142,13 @@ class reader(lsts):
                          "begin state_props", "end state_props",
                          "begin layout", "end layout",
                          "end lsts"]
-        import re
+        self.__section_readers={
+            "begin history": self.__read_history,
+            "begin header": self.__read_header,
+            "begin action_names": self.__read_action_names,
+            "begin transitions": self.__read_transitions,
+            "begin state_props": self.__read_stateprops,
+            "begin layout": self.__read_layout}
         self.__headerrow=re.compile('\s*(\S+)\s*=\s*([0-9]+)[^0-9]')
         self.__actionnamerow=re.compile('\s*([0-9]+)\s*=\s*"(([^"]|\\")*)"')
         self.__actionnamemultirow_start1=re.compile('\s*([0-9]+)\s*=\s*"([^\\\\]*)\\\\\^\s*$')
@@ -419,133 +1164,459 @@ class reader(lsts):
         if file:
             self.read()
             self.__already_read=1
+
     def read(self,file=None):
         """
+        Reads the LSTS from the file given here or in the constructor.
+
+        Notes:
+
+        The file is read in one pass. Each section is parsed by its
+        own method that consumes rows until the end of the section.
+
+        gzip, bzip2 and xz compressed files are decompressed while
+        reading. Binary lstsb files are detected by their first bytes.
+        They are memory mapped if possible, and destination state and
+        action arrays of transitions refer to the mapped data without
+        copying it.
         """
         if self.__already_read:
             self.__already_read=0
             return
         if not file:
             file=self.__file
-        sidx=0 # index of section that we expect to read next
-        secs=self.__sections
-        layout_rows=[]
-        l=file.readline()
+        self.__pending={}
+        self.__rest=None
+        if self.__wanted!=None:
+            self.__loaded=set()
+        head=_head(file)
+        if fmbtcompress and fmbtcompress.compression(head):
+            file=fmbtcompress.decompressed(file,head)
+            head=_head(file)
+        if head==_LSTSB_MAGIC:
+            self.__read_lstsb(_lstsb_data(file,head))
+        elif self.__wanted==None:
+            self.__read_sections(_lines(file,head))
+        else:
+            self.__read_selected(_section_lines(file,head))
+
+    def __read_sections(self,lines,skip=()):
+        """
+        Reads sections from lines until the end of lsts. Sections
+        whose names are in skip are passed.
+        """
+        section_readers=self.__section_readers
+        l=next(lines,"")
         while l:
+            section=l.replace(chr(0x0d),'').strip().lower()
+            if section in section_readers:
+                if section[6:] in skip:
+                    for l in lines:
+                        if self.__section_row(l):
+                            break
+                    else:
+                        l=""
+                    continue
+                # returns the row that ended the section
+                l=section_readers[section](lines)
+                continue
+            elif section=="end lsts":
+                break
+            l=next(lines,"")
+
+    def __read_selected(self,lines):
+        """
+        Reads wanted sections from _section_lines lines. Other
+        sections are skipped and read later by __load. Reading stops
+        when all wanted sections have been read.
+        """
+        section_readers=self.__section_readers
+        wanted=set(self.__wanted)
+        l=next(lines,"")
+        while l and wanted:
+            section=l.replace(chr(0x0d),'').strip().lower()
+            if section in section_readers:
+                name=section[6:]
+                if name in wanted:
+                    wanted.remove(name)
+                    self.__loaded.add(name)
+                    l=section_readers[section](lines)
+                    continue
+                self.__pending[name]=(
+                    lambda r=section_readers[section],
+                           source=lines.skip_section(name): r(source()))
+            elif section=="end lsts":
+                return
+            l=next(lines,"")
+        if l:
+            self.__rest=lines.rest()
+
+    def __load(self,name):
+        """
+        Reads section name if it has been skipped.
+        """
+        if name in self.__loaded:
+            return
+        if name in self.__pending:
+            self.__pending.pop(name)()
+        elif self.__rest:
+            rest,self.__rest=self.__rest,None
+            self.__read_sections(rest(),self.__loaded)
+            # sections after the skipped ones have been read now
+            self.__loaded.update([n for n in _SECTION_NAMES
+                                  if not n in self.__pending])
+        self.__loaded.add(name)
+
+    def __set(self,name):
+        """
+        Section name is given by a setter and must not be read.
+        """
+        self.__loaded.add(name)
+        self.__pending.pop(name,None)
+
+    def set_actionnames(self,actionnames):
+        self.__set("action_names")
+        lsts.set_actionnames(self,actionnames)
+
+    def set_transitions(self,transitions):
+        self.__set("transitions")
+        lsts.set_transitions(self,transitions)
+
+    def set_stateprops(self,stateprops):
+        self.__set("state_props")
+        lsts.set_stateprops(self,stateprops)
+
+    def set_layout(self,layout):
+        self.__set("layout")
+        lsts.set_layout(self,layout)
+
+    def get_history(self):
+        self.__load("history")
+        return lsts.get_history(self)
+
+    def get_actionnames(self):
+        self.__load("action_names")
+        return lsts.get_actionnames(self)
+
+    def get_transitions(self):
+        self.__load("transitions")
+        return lsts.get_transitions(self)
+
+    def out_transitions(self,state):
+        self.__load("transitions")
+        return lsts.out_transitions(self,state)
+
+    def get_stateprops(self):
+        self.__load("state_props")
+        return lsts.get_stateprops(self)
+
+    def get_layout(self):
+        self.__load("layout")
+        return lsts.get_layout(self)
+
+    def __read_lstsb(self,data):
+        pos=len(_LSTSB_MAGIC)
+        (version,state_cnt,action_cnt,transition_cnt,state_prop_cnt,
+         initial_state)=struct.unpack_from(_LSTSB_HEADER,data,pos)
+        if version!=_LSTSB_VERSION:
+            raise ValueError("Unsupported lstsb version: %s" % version)
+        pos+=_LSTSB_HEADER_SIZE
+        sections={}
+        for name in _LSTSB_SECTIONS:
+            sections[name]=struct.unpack_from(_LSTSB_SECTION,data,pos)
+            pos+=_LSTSB_SECTION_SIZE
+
+        self._header.state_cnt=state_cnt
+        self._header.action_cnt=action_cnt
+        self._header.transition_cnt=transition_cnt
+        if state_prop_cnt>0:
+            self._header.state_prop_cnt=state_prop_cnt
+        self._header.initial_states=initial_state
+
+        section_readers={"history": self.__read_lstsb_history,
+                         "action_names": self.__read_lstsb_action_names,
+                         "transitions": self.__read_lstsb_transitions,
+                         "state_props": self.__read_lstsb_stateprops,
+                         "layout": self.__read_lstsb_layout}
+        for name,section_reader in section_readers.iteritems():
+            if self.__wanted==None or name in self.__wanted:
+                section_reader(data,sections)
+            else:
+                self.__pending[name]=(
+                    lambda r=section_reader: r(data,sections))
+        self.__loaded.add("header")
+
+    def __read_lstsb_history(self,data,sections):
+        self._history=_lstsb_read_strings(data,*sections["history"])
+
+    def __read_lstsb_action_names(self,data,sections):
+        self._actionnames=_lstsb_read_strings(data,*sections["action_names"])
+
+    def __read_lstsb_transitions(self,data,sections):
+        transitions=csr_transitions()
+        # offsets are looked up on every out_transitions call, and
+        # they are small compared to dests and actions
+        transitions.offsets=_lstsb_read_ints(data,*sections["offsets"])[:]
+        transitions.dests=_lstsb_read_ints(data,*sections["dests"])
+        transitions.actions=_lstsb_read_ints(data,*sections["actions"])
+        self._transitions=transitions
+
+    def __read_lstsb_stateprops(self,data,sections):
+        offset=sections["stateprops"][0]
+        bitset_len=(self._header.state_cnt+7)//8
+        for name in _lstsb_read_strings(data,*sections["stateprop_names"]):
+            self._stateprops[name]=_lstsb_read_bitset(data,offset,bitset_len)
+            offset+=bitset_len
+
+    def __read_lstsb_layout(self,data,sections):
+        self._layout=[None for _ in xrange(self._header.state_cnt)]
+        layout=_lstsb_read_ints(data,*sections["layout"])[:]
+        for i in xrange(0,len(layout),3):
+            self._layout[layout[i]]=(layout[i+1],layout[i+2])
+
+    def __section_row(self,l):
+        """
+        Returns True if row l begins or ends a section.
+        """
+        return l.replace(chr(0x0d),'').strip().lower() in self.__sections
+
+    def __continued_row(self,l,lines):
+        """
+        Returns transition or state proposition row that starts with l
+        and continues on the following lines until ';'.
+        """
+        parts=[l]
+        for newline in lines:
+            # if there is only one white space in the front of the new row,
+            # delete it... it may be that there should not be white space
+            if parts[-1].rstrip("\r\n")[-2:]==".." or newline[:3]==" ..":
+                newline=newline.lstrip()
+            parts[-1]=parts[-1].rstrip()
+            parts.append(newline)
+            if ";" in newline:
+                break
+        return "".join(parts)
+
+    def __read_history(self,lines):
+        for l in lines:
+            if self.__section_row(l):
+                return l
+            l=l.replace(chr(0x0d),'').strip()
+            if l:
+                self._history.append(l)
+        return ""
+
+    def __read_header(self,lines):
+        for l in lines:
+            if self.__section_row(l):
+                return l
+            res=self.__headerrow.search(l.replace(chr(0x0d),''))
+            if res and int(res.group(2))>0:
+                if res.group(1).lower()=="action_cnt":
+                    self._actionnames=["tau"] + ['N/A' for i in xrange(0,int(res.group(2)))]
+                    self._header.action_cnt=int(res.group(2))
+                elif res.group(1).lower()=="state_cnt":
+                    self._header.state_cnt=int(res.group(2))
+                    self._transitions=csr_transitions()
+                    self._transitions.offsets=array('i',[0])*(self._header.state_cnt+1)
+                    self._layout=[None for _ in xrange(self._header.state_cnt)]
+                elif res.group(1).lower()=="transition_cnt":
+                    self._header.transition_cnt=int(res.group(2))
+                elif res.group(1).lower()=="state_prop_cnt":
+                    self._header.state_prop_cnt=int(res.group(2))
+                elif res.group(1).lower()=="initial_states":
+                    self._header.initial_states=int(res.group(2))-1 # only one allowed (BAD)
+        return ""
+
+    def __read_action_names(self,lines):
+        actionname_in_multirow=-1
+        for l in lines:
+            if self.__section_row(l):
+                return l
             l=l.replace(chr(0x0d),'')
-            if l.strip().lower() in secs: # move to the next section
-                sidx=secs.index(l.strip().lower())
-
-            elif secs[sidx]=="begin history":
-                self._history.append(l.strip())
-
-            elif secs[sidx]=="begin header": # parse a header row
-                res=self.__headerrow.search(l)
-                if res and int(res.group(2))>0:
-                    if res.group(1).lower()=="action_cnt":
-                        self._actionnames=["tau"] + ['N/A' for i in xrange(0,int(res.group(2)))]
-                        self._header.action_cnt=int(res.group(2))
-                        actionname_in_multirow=-1
-                    elif res.group(1).lower()=="state_cnt":
-                        self._header.state_cnt=int(res.group(2))
-                        self._transitions=[ [] for _ in xrange(0,self._header.state_cnt) ]
-                        self._layout=[None for _ in xrange(self._header.state_cnt)]
-                    elif res.group(1).lower()=="transition_cnt":
-                        self._header.transition_cnt=int(res.group(2))
-                    elif res.group(1).lower()=="state_prop_cnt":
-                        self._header.state_prop_cnt=int(res.group(2))
-                    elif res.group(1).lower()=="initial_states":
-                        self._header.initial_states=int(res.group(2))-1 # only one allowed (BAD)
-
-            elif secs[sidx]=="begin action_names": # parse an action name row
-                res=self.__actionnamerow.search(l)
-                if res and int(res.group(1))>0:
-                    self._actionnames[int(res.group(1))]=res.group(2).replace('\\"', '"')
-                    actionname_in_multirow=-1
+            if l.strip()=="":
+                continue
+            res=self.__actionnamerow.search(l)
+            if res and int(res.group(1))>0:
+                self._actionnames[int(res.group(1))]=res.group(2).replace('\\"','"')
+                actionname_in_multirow=-1
+            elif actionname_in_multirow==-1:
+                res=self.__actionnamemultirow_start1.search(l)
+                if res:
+                    # store the number of the action whose name
+                    # is given in multiple rows
+                    actionname_in_multirow=int(res.group(1))
+                    self._actionnames[actionname_in_multirow]=res.group(2)
+                else: # real hack. parse 'number = \n "action name"'
+                    res=self.__actionnamemultirow_start2.search(l)
+                    if res:
+                        nextline=next(lines,"")
+                        while nextline.strip()=="": nextline=next(lines,"")
+                        self._actionnames[int(res.group(1))]=\
+                            nextline.replace(chr(0x0d),'').split('"',1)[1].rsplit('"',1)[0]
+            else:
+                res=self.__actionnamemultirow_cont.search(l)
+                if res:
+                    self._actionnames[actionname_in_multirow]+=res.group(1)
                 else:
-                    if actionname_in_multirow==-1:
-                        res=self.__actionnamemultirow_start1.search(l)
-                        if res:
-                            # store the number of the action whose name
-                            # is given in multiple rows
-                            actionname_in_multirow=int(res.group(1))
-                            self._actionnames[actionname_in_multirow]=res.group(2)
-                        else: # real hack. parse 'number = \n "action name"'
-                            res=self.__actionnamemultirow_start2.search(l)
-                            if res:
-                                nextline=file.readline()
-                                while nextline.strip()=="": nextline=file.readline()
-                                self._actionnames[int(res.group(1))]=\
-                                    nextline.split('"',1)[1].rsplit('"',1)[0]
-                    else:
-                        res=self.__actionnamemultirow_cont.search(l)
-                        if res:
-                            self._actionnames[actionname_in_multirow]+=res.group(1)
+                    res=self.__actionnamemultirow_end.search(l)
+                    if res:
+                        self._actionnames[actionname_in_multirow]+=res.group(1)
+                        actionname_in_multirow=-1
+        return ""
+
+    def __read_transitions(self,lines):
+        # Rows are appended to dests and actions as they come. Row
+        # sources and ends are recorded to build offsets afterwards.
+        dests=array('i')
+        actions=array('i')
+        row_sources=array('i')
+        row_ends=array('i')
+        end_row=""
+        for l in lines:
+            if not ";" in l:
+                if self.__section_row(l):
+                    end_row=l
+                    break
+                if l.strip()=="":
+                    continue
+                l=self.__continued_row(l,lines)
+            row=l[:l.rfind(";")]
+            if not '"' in row and not "{" in row:
+                # fast path: "source: dest,action dest,action ..."
+                try:
+                    numbers=map(int,row.replace(","," ").replace(":"," ").split())
+                except ValueError:
+                    numbers=None
+                if numbers:
+                    if numbers[0]>0:
+                        if not len(numbers)%2:
+                            numbers.pop()
+                        dests.extend([d-1 for d in numbers[1::2]])
+                        actions.extend(numbers[2::2])
+                        row_sources.append(numbers[0]-1)
+                        row_ends.append(len(dests))
+                    continue
+            res=self.__transitionrow.search(l.replace(chr(0x0d),''))
+            if res and int(res.group(1))>0:
+                l=self.__cleanrow(res.group(2)).split()
+                for (dest_state,action_index) in \
+                        [ (l[i],l[i+1]) for i in range(0,len(l))[::2] ]:
+                    dests.append(int(dest_state)-1)
+                    actions.append(int(action_index))
+                row_sources.append(int(res.group(1))-1)
+                row_ends.append(len(dests))
+        self.__set_csr_transitions(dests,actions,row_sources,row_ends)
+        return end_row
+
+    def __set_csr_transitions(self,dests,actions,row_sources,row_ends):
+        """
+        Builds offsets of csr_transitions from rows read in any order.
+        """
+        state_cnt=len(self._transitions)
+        counts=array('i',[0])*state_cnt
+        in_order=1
+        previous=-1
+        row_start=0
+        for source,row_end in izip(row_sources,row_ends):
+            counts[source]+=row_end-row_start
+            row_start=row_end
+            if source<=previous:
+                in_order=0
+            previous=source
+        offsets=array('i',[0])*(state_cnt+1)
+        total=0
+        for state,count in enumerate(counts):
+            total+=count
+            offsets[state+1]=total
+        if not in_order:
+            # place rows of each source state after each other in
+            # the order they were read
+            sorted_dests=array('i',[0])*len(dests)
+            sorted_actions=array('i',[0])*len(actions)
+            positions=offsets[:-1]
+            row_start=0
+            for source,row_end in izip(row_sources,row_ends):
+                pos=positions[source]
+                new_pos=pos+row_end-row_start
+                sorted_dests[pos:new_pos]=dests[row_start:row_end]
+                sorted_actions[pos:new_pos]=actions[row_start:row_end]
+                positions[source]=new_pos
+                row_start=row_end
+            dests,actions=sorted_dests,sorted_actions
+        transitions=csr_transitions()
+        transitions.offsets=offsets
+        transitions.dests=dests
+        transitions.actions=actions
+        self._transitions=transitions
+
+    def __read_stateprops(self,lines):
+        for l in lines:
+            if not ";" in l:
+                if self.__section_row(l):
+                    return l
+                if l.strip()=="":
+                    continue
+                l=self.__continued_row(l,lines)
+            l=l.replace(chr(0x0d),'')
+            # fast path: '"name" : 1 2 5..8;'
+            end=l.rfind(";")
+            colon=l.rfind(":",0,end)
+            name=l[:colon].strip()
+            proplist=None
+            if len(name)>1 and name[0]=='"' and name[-1]=='"':
+                try:
+                    proplist=[]
+                    for propitem in l[colon+1:end].split():
+                        if ".." in propitem:
+                            # range of numbers: x..y
+                            first,last=propitem.split("..")
+                            proplist.extend(xrange(int(first)-1,int(last)))
                         else:
-                            res=self.__actionnamemultirow_end.search(l)
-                            if res:
-                                self._actionnames[actionname_in_multirow]+=res.group(1)
-                                actionname_in_multirow=-1
-
-            elif secs[sidx]=="begin transitions": # parse a transition row
-                res=self.__transitionrow.search(l)
-                if res and int(res.group(1))>0:
-                    starting_state=int(res.group(1))-1
-                    l=self.__cleanrow(res.group(2)).split()
-                    for (dest_state,action_index) in \
-                            [ (l[i],l[i+1]) for i in range(0,len(l))[::2] ]:
-                        self._transitions[starting_state].append(
-                            (int(dest_state)-1,int(action_index)) )
-
-            elif secs[sidx]=="begin state_props": # parse state proposition row
+                            proplist.append(int(propitem)-1) # off-by-one
+                    propname=name[1:-1].replace('\\"','"')
+                except ValueError:
+                    proplist=None
+            if proplist==None:
                 res=self.__stateproprow.search(l)
-                if res:
-                    propname=res.group(1).replace('\\"', '"')
-                    proplist=[]
-                    for propitem in res.group(3).split():
+                if not res:
+                    continue
+                propname=res.group(1).replace('\\"','"')
+                proplist=[]
+                for propitem in res.group(3).split():
+                    try:
+                        # single number
+                        propnum=int(propitem)-1 # off-by-one
+                        proplist.append(propnum)
+                    except ValueError:
+                        # range of numbers: x..y
                         try:
-                            # single number
-                            propnum=int(propitem)-1 # off-by-one
-                            proplist.append(propnum)
+                            proprange=[int(x) for x in propitem.split("..")]
                         except ValueError:
-                            # range of numbers: x..y
-                            try:
-                                proprange=[int(x) for x in propitem.split("..")]
-                            except ValueError:
-                                print propitem
-                            proprange[0]-=1 # off-by-one
-                            proplist.extend(range(*proprange))
-                    proplist.sort()
-                    self._stateprops[propname]=proplist
-
-            elif secs[sidx]=="begin layout":
-                layout_numbers=l.strip().split()
-                try:
-                    statenum, xcoord, ycoord = [int(x) for x in layout_numbers]
-                except ValueError:
-                    raise ValueError("Layout section has an illegal row: '%s'" % l.strip())
-                statenum-=1
-                try:
-                    self._layout[statenum]=(xcoord,ycoord)
-                except IndexError:
-                    raise IndexError("Illegal state number in layout section: %s" % statenum)
-
-            if sidx == len(secs): # we are ready
-                break
-            else:
-                l=file.readline()
-                while l.strip()=="":
-                    if not l: break
-                    l=file.readline()
-                if secs[sidx]=="begin state_props" or secs[sidx]=="begin transitions":
-                    while (not l.lower().strip() in secs) and (not ";" in l):
-                        newline=file.readline()
-                        if not newline: break
-                        # if there is only one white space in the front of the new row,
-                        # delete it... it may be that there should not be white space
-                        if l[-3:-1]==".." or newline[:3]==" ..":
-                            newline=newline.lstrip()
-                        l=l.rstrip()+newline
+                            print propitem
+                        proprange[0]-=1 # off-by-one
+                        proplist.extend(range(*proprange))
+            proplist.sort()
+            self._stateprops[propname]=proplist
+        return ""
+
+    def __read_layout(self,lines):
+        for l in lines:
+            if self.__section_row(l):
+                return l
+            layout_numbers=l.strip().split()
+            if not layout_numbers:
+                continue
+            try:
+                statenum,xcoord,ycoord=[int(x) for x in layout_numbers]
+            except ValueError:
+                raise ValueError("Layout section has an illegal row: '%s'" % l.strip())
+            statenum-=1
+            try:
+                self._layout[statenum]=(xcoord,ycoord)
+            except IndexError:
+                raise IndexError("Illegal state number in layout section: %s" % statenum)
+        return ""
 
 try:
     import psyco
@@ -603,3 +1674,24 @@ if __name__=="__main__":
         print outf1.s
         print "---2--"
         print outf2.s
+
+    outf3=fakefile("")
+    w.write_lstsb(outf3)
+    outf4=filu()
+    writer(file=outf4,lsts_object=reader(outf3))
+
+    test="Write lstsb - read lstsb - write (the written LSTSs should be the same)"
+    if outf2.s==outf4.s:
+        print "PASS",test
+    else:
+        print "FAIL",test
+
+    r=reader(fakefile(outf2.s),sections=("header","action_names"))
+    outf5=filu()
+    writer(file=outf5,lsts_object=r)
+
+    test="Read header and action names - write (transitions are read when accessed)"
+    if r.get_actionnames()==["tau","a","b","c"] and outf2.s==outf5.s:
+        print "PASS",test
+    else:
+        print "FAIL",test
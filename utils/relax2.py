@@ -41,9 +41,10 @@ class DFA_lsts:
             self.addprops(L.get_stateprops())
     def addtrans(self,tr):    
         self.Trans = []
-        for i,tl in enumerate(tr):
+        out_transitions=getattr(tr,"out_transitions",tr.__getitem__)
+        for i in xrange(len(tr)):
             self.Trans.append({})
-            for (dest,act) in tl:
+            for (dest,act) in out_transitions(i):
                 if not act in self.Trans[i]:
                     self.Trans[i][act] =set([dest])
                 else: